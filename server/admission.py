@@ -0,0 +1,84 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+
+class QueueFull(Exception):
+    """Raised when the executor already holds as much work as it may queue"""
+
+
+class BoundedExecutor:
+    """Thread pool that refuses work instead of queueing it without limit.
+
+    At most ``max_workers`` tasks run at once and at most ``max_queue`` more
+    wait for a thread; ``submit`` raises QueueFull beyond that so callers can
+    shed load (e.g. answer 429) while latency is still bounded.
+    """
+
+    def __init__(self, max_workers, max_queue):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    @property
+    def in_flight(self):
+        """Tasks running or waiting for a thread"""
+        return self._in_flight
+
+    def reserve(self):
+        """Take a slot for work that runs outside the pool
+
+        Raises QueueFull when none is free; hand the slot back with release().
+        """
+        if not self._slots.acquire(blocking=False):
+            raise QueueFull()
+        with self._lock:
+            self._in_flight += 1
+
+    def release(self):
+        """Give back a slot taken with reserve()"""
+        self._release(None)
+
+    def submit(self, fn, *args, **kwargs):
+        self.reserve()
+        try:
+            future = self._get_executor().submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        """Run fn in the pool and wait for its result
+
+        Raises QueueFull when the pool is saturated and
+        concurrent.futures.TimeoutError if the result takes over `timeout`
+        seconds (the task is cancelled if it has not started yet).
+        """
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def _release(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _get_executor(self):
+        # A pool created before fork() has no threads in the child, so
+        # create one per process
+        pid = os.getpid()
+        if self._executor is None or self._executor_pid != pid:
+            with self._lock:
+                if self._executor is None or self._executor_pid != pid:
+                    self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='inference')
+                    self._executor_pid = pid
+        return self._executor
@@ -0,0 +1,87 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class BatchPredictor:
+    """Groups concurrent single-image predictions into one batched model call.
+
+    Callers submit a preprocessed ``(1, H, W, C)`` array and block until the
+    background worker has run it as part of an ``(N, H, W, C)`` batch. A batch
+    is dispatched as soon as ``max_batch_size`` requests are waiting or the
+    oldest request has waited ``max_wait_ms``, whichever comes first.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+
+    def predict(self, img_array, timeout=None):
+        """Run one preprocessed image through the model and return its scores"""
+        return self.submit(img_array).result(timeout=timeout)
+
+    def submit(self, img_array):
+        """Queue one preprocessed image and return a Future for its scores"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((img_array, future))
+        return future
+
+    def queue_depth(self):
+        """Number of images waiting to be batched"""
+        return self._queue.qsize()
+
+    def _ensure_worker(self):
+        # Threads do not survive fork(), so (re)start the worker lazily in
+        # whichever process first submits work.
+        pid = os.getpid()
+        if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run, name='batch-predictor', daemon=True)
+            self._worker_pid = pid
+            self._worker.start()
+
+    def _collect_batch(self):
+        """Block for the first request, then gather more until the window closes"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Drop requests whose callers gave up before the batch was formed
+            batch = [item for item in self._collect_batch() if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            futures = [future for _, future in batch]
+            try:
+                inputs = np.concatenate([img_array for img_array, _ in batch], axis=0)
+                predictions = self.predict_fn(inputs)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            for i, future in enumerate(futures):
+                future.set_result(predictions[i])
@@ -0,0 +1,338 @@
+"""Microbenchmarks for the inference and recommendation hot paths
+
+Usage:
+    python benchmark.py --sizes 18,1000,100000,1000000 --output results.json
+    python benchmark.py --compare before.json after.json
+
+Times JPEG decoding with and without DCT downscaling, preprocess_image,
+predict_disease (the configured model and the mock
+path used when no model is loaded), the raw model call, recommend_products,
+get_recommendations and an incremental catalog update (one product added,
+then deleted). The recommendation benchmarks run against
+synthetic catalogs scaled from the built-in 18 products, with every copy
+given extra random tags so products don't collapse into a few duplicates.
+
+The model is loaded the way main.py loads it, so the DERMIQ_* variables
+(e.g. DERMIQ_INFERENCE_BACKEND) select what is measured. The prediction
+cache is disabled so every call reaches the model; predict_disease still
+goes through the micro-batcher, so a lone caller includes its batching wait.
+
+Results are written as JSON together with the commit and machine they were
+measured on; --compare prints the relative change of every benchmark that
+appears in both files. Only compare runs from the same machine.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_SIZES = '18,1000,10000,100000,1000000'
+# Neighbour lists take O(n^2) time to build; larger catalogs are benchmarked
+# without them, which only affects requests that list prior products
+DEFAULT_NEIGHBOR_LIMIT = 20000
+# Image dimensions (width, height) decoded by the preprocess benchmarks
+IMAGE_SIZES = [(128, 128), (640, 480), (1920, 1080)]
+# Camera resolutions for the decode benchmarks, up to a 12 MP phone photo
+DECODE_SIZES = [(640, 480), (1920, 1080), (4032, 3024)]
+
+PROFILES = [
+    {'age': age, 'gender': 'female', 'skinType': skin_type, 'allergies': allergies}
+    for age in (12, 35, 70)
+    for skin_type in ('dry', 'oily', 'sensitive', 'normal', '')
+    for allergies in ([], ['fragrance'], ['salicylic acid', 'coal tar'])
+]
+DISEASES = ["Psoriasis", "Ringworm", "Shingles", "Vitiligo", "Eczema"]
+
+
+def measure(fn, min_time=0.2, repeat=5):
+    """Time fn() like timeit: `repeat` rounds of enough calls to last min_time
+
+    Returns per-call statistics in milliseconds; the minimum is the least
+    noisy figure to compare across runs.
+    """
+    def timed(number):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        return time.perf_counter() - start
+
+    fn()  # Warm up caches and lazy initialisation
+    number = 1
+    while True:
+        elapsed = timed(number)
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number = max(2 * number, int(number * min_time / max(elapsed, 1e-9)))
+
+    rounds = np.array([timed(number) / number * 1000 for _ in range(repeat)])
+    return {
+        'calls_per_round': number,
+        'rounds': repeat,
+        'min_ms': float(rounds.min()),
+        'median_ms': float(np.median(rounds)),
+        'mean_ms': float(rounds.mean()),
+        'max_ms': float(rounds.max()),
+    }
+
+
+def cycle(items):
+    """Callable-friendly round robin over items"""
+    position = [0]
+
+    def next_item():
+        item = items[position[0] % len(items)]
+        position[0] += 1
+        return item
+    return next_item
+
+
+def synthetic_image(width, height, seed=0, fmt='JPEG'):
+    """Encoded bytes of a smooth random image of the given size"""
+    rng = np.random.default_rng(seed)
+    # Upscaled noise compresses like a photo rather than like pure noise
+    small = rng.integers(0, 256, size=(max(1, height // 16), max(1, width // 16), 3), dtype=np.uint8)
+    img = Image.fromarray(small).resize((width, height), Image.BILINEAR)
+    buffer = io.BytesIO()
+    img.save(buffer, fmt, quality=90) if fmt == 'JPEG' else img.save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def synthetic_catalog(base_df, size, seed=0):
+    """Scale a catalog to `size` products by copying it with random extra tags"""
+    rng = np.random.default_rng(seed)
+    df = base_df.iloc[np.arange(size) % len(base_df)].reset_index(drop=True)
+    ids = np.arange(1, size + 1)
+    words = np.array([f"variant{i}" for i in range(max(64, size // 20))])
+    extra = words[rng.integers(0, len(words), size=(size, 3))]
+    df['id'] = ids
+    df['name'] = df['name'] + ' #' + ids.astype(str)
+    df['tags'] = df['tags'] + ' ' + [' '.join(row) for row in extra]
+    return df
+
+
+def build_recommender(base, products_df, neighbor_limit):
+    """A recommender serving products_df, sharing base's configuration"""
+    from catalog_index import CatalogIndex
+    from recommendation import CatalogState, SkinCareRecommender
+    from similarity import TopKNeighbors
+
+    recommender = SkinCareRecommender.__new__(SkinCareRecommender)
+    recommender.__dict__.update(base.__dict__)
+    recommender._profile_vectors = {}
+    recommender._ranked = {}
+    recommender._recommendation_cache = OrderedDict()
+
+    features = recommender._prepare_product_features(products_df)
+    if len(products_df) <= neighbor_limit:
+        neighbors = TopKNeighbors.build(features, k=recommender.num_neighbors)
+    else:
+        n, k = len(products_df), recommender.num_neighbors
+        neighbors = TopKNeighbors(np.full((n, k), -1, dtype=np.int32), np.zeros((n, k), dtype=np.float32))
+    recommender.catalog = CatalogState(1, CatalogIndex(products_df), features, neighbors)
+    return recommender
+
+
+def bench_decode(results, min_time, repeat):
+    import imaging
+    for width, height in DECODE_SIZES:
+        data = synthetic_image(width, height)
+        for fast_decode in (False, True):
+            name = f"decode/jpeg/{width}x{height}/{'draft' if fast_decode else 'full'}"
+            results[name] = {**measure(lambda: imaging.load_image_array(data, fast_decode=fast_decode),
+                                       min_time, repeat),
+                             'bytes': len(data)}
+            print(f"{name}: {results[name]['min_ms']:.3f} ms", file=sys.stderr)
+
+
+def bench_preprocess(results, min_time, repeat):
+    import main
+    for width, height in IMAGE_SIZES:
+        for fmt in ('JPEG', 'PNG'):
+            data = synthetic_image(width, height, fmt=fmt)
+            name = f"preprocess_image/{fmt.lower()}/{width}x{height}"
+            results[name] = {**measure(lambda: main.preprocess_image(data), min_time, repeat),
+                             'bytes': len(data)}
+            print(f"{name}: {results[name]['min_ms']:.3f} ms", file=sys.stderr)
+
+
+def bench_predict(results, min_time, repeat):
+    import main
+    images = cycle([synthetic_image(640, 480, seed=seed) for seed in range(8)])
+
+    if main.model_loaded:
+        name = f"predict_disease/{main.model_status}"
+        results[name] = measure(lambda: main.predict_disease(images()), min_time, repeat)
+        print(f"{name}: {results[name]['min_ms']:.3f} ms", file=sys.stderr)
+
+        batch = main.preprocess_image(images())
+        for batch_size in (1, 8, 32):
+            name = f"model_predict/{main.model_status}/batch{batch_size}"
+            inputs = np.repeat(batch, batch_size, axis=0)
+            results[name] = measure(lambda: main.inference_backend.predict(inputs), min_time, repeat)
+            print(f"{name}: {results[name]['min_ms']:.3f} ms", file=sys.stderr)
+    else:
+        print(f"Model not loaded ({main.model_status}); skipping the real predict_disease benchmark",
+              file=sys.stderr)
+
+    model_loaded, main.model_loaded = main.model_loaded, False
+    try:
+        name = "predict_disease/mock"
+        results[name] = measure(lambda: main.predict_disease(images()), min_time, repeat)
+        print(f"{name}: {results[name]['min_ms']:.3f} ms", file=sys.stderr)
+    finally:
+        main.model_loaded = model_loaded
+
+
+def bench_recommend(results, sizes, neighbor_limit, min_time, repeat):
+    import main
+    base = main.recommender
+    requests = cycle([(disease, profile) for disease in DISEASES for profile in PROFILES])
+
+    for size in sizes:
+        start = time.perf_counter()
+        products_df = synthetic_catalog(base.products_df, size)
+        recommender = build_recommender(base, products_df, neighbor_limit)
+        setup = {'catalog_size': size, 'neighbors': size <= neighbor_limit,
+                 'build_seconds': time.perf_counter() - start}
+        print(f"catalog {size}: built in {setup['build_seconds']:.2f} s", file=sys.stderr)
+
+        prior_ids = [int(i) for i in products_df['id'][:3]]
+
+        def recommend_with_prior_products():
+            disease, profile = requests()
+            return recommender.recommend_products(disease, {**profile, 'priorProducts': prior_ids})
+
+        # Adds one product and deletes it again, so the delete-only path runs too
+        added = products_df.iloc[[0]].assign(id=size + 1)
+
+        def add_and_delete_product():
+            recommender.apply_catalog_changes(added)
+            recommender.apply_catalog_changes(None, [size + 1])
+
+        benchmarks = {
+            'recommend_products': lambda: recommender.recommend_products(*requests()),
+            'get_recommendations': lambda: recommender.get_recommendations(*requests()),
+        }
+        if setup['neighbors']:
+            benchmarks['recommend_products_prior'] = recommend_with_prior_products
+
+        # Uncached first, then with the recommendation cache warm (the
+        # profiles cycle through a few hundred distinct keys)
+        for cached in (False, True):
+            recommender.cache_size = base.cache_size if cached else 0
+            recommender.clear_cache()
+            for label, fn in benchmarks.items():
+                if cached:
+                    for _ in range(len(DISEASES) * len(PROFILES)):
+                        fn()
+                name = f"{label}{'_cached' if cached else ''}/{size}"
+                results[name] = {**measure(fn, min_time, repeat), **setup}
+                print(f"{name}: {results[name]['min_ms']:.3f} ms", file=sys.stderr)
+
+        name = f"catalog_update/{size}"
+        results[name] = {**measure(add_and_delete_product, min_time, repeat), **setup}
+        print(f"{name}: {results[name]['min_ms']:.3f} ms", file=sys.stderr)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    import main
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'backend': main.model_status,
+    }
+
+
+def run(args):
+    # Set before main is imported: every prediction should reach the model
+    os.environ['DERMIQ_PREDICTION_CACHE_ENTRIES'] = '0'
+    os.environ['DERMIQ_CATALOG_RELOAD_SECONDS'] = '0'
+    import main
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    only = set(args.only.split(',')) if args.only else {'decode', 'preprocess', 'predict', 'recommend'}
+
+    results = {}
+    if 'decode' in only:
+        bench_decode(results, args.min_time, args.repeat)
+    if 'preprocess' in only:
+        bench_preprocess(results, args.min_time, args.repeat)
+    if 'predict' in only:
+        bench_predict(results, args.min_time, args.repeat)
+    if 'recommend' in only:
+        bench_recommend(results, sizes, args.neighbor_limit, args.min_time, args.repeat)
+
+    report = json.dumps({'environment': environment(), 'results': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+
+def compare(args):
+    """Print the change in minimum time of every benchmark in both reports"""
+    before_path, after_path = args.compare
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    for key in ('platform', 'processor', 'cpu_count', 'backend'):
+        if before['environment'].get(key) != after['environment'].get(key):
+            print(f"Warning: {key} differs between the runs", file=sys.stderr)
+
+    rows = {}
+    for name in sorted(set(before['results']) & set(after['results'])):
+        old, new = before['results'][name]['min_ms'], after['results'][name]['min_ms']
+        rows[name] = {'before_ms': old, 'after_ms': new, 'change': new / old - 1 if old else None}
+        change = f"{rows[name]['change']:+.1%}" if old else 'n/a'
+        print(f"{name:50s} {old:10.3f} ms -> {new:10.3f} ms  {change}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'before': before['environment'], 'after': after['environment'], 'results': rows}, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Comma-separated catalog sizes')
+    parser.add_argument('--only', help='Comma-separated subset of decode,preprocess,predict,recommend')
+    parser.add_argument('--neighbor-limit', type=int, default=DEFAULT_NEIGHBOR_LIMIT,
+                        help='Largest catalog to build neighbour lists for')
+    parser.add_argument('--min-time', type=float, default=0.2, help='Seconds per timing round')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing rounds per benchmark')
+    parser.add_argument('--output', help='Write the results (or comparison) as JSON here instead of stdout')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='Compare two result files instead of running the benchmarks')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args)
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""Score recommendations for a large file of user profiles
+
+Usage:
+    python bulk_recommend.py profiles.csv recommendations.jsonl --workers 8
+
+Input is CSV or JSONL with disease, age, gender, skinType and allergies
+columns (allergies comma-separated in CSV, a list or string in JSONL).
+Output is JSONL with one line per input row, in input order, holding the
+profile plus its remedies and products.
+
+Rows are read and scored in chunks. Within a chunk, profiles that must get
+the same recommendations (same disease, skin type, age bracket and
+allergies) are grouped so each distinct profile is scored once. Chunks are
+spread over a process pool, with at most two chunks per worker in flight.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from recommendation import SkinCareRecommender
+
+# Recommender used by the current worker process
+_recommender = None
+# JSON-encoded results of the groups this worker has already scored
+_scored_groups = {}
+MAX_SCORED_GROUPS = 100000
+
+
+def read_profiles(path, chunk_size):
+    """Yield DataFrame chunks of profiles from a CSV or JSONL file"""
+    if path.endswith('.csv'):
+        reader = pd.read_csv(path, chunksize=chunk_size, dtype=str, keep_default_na=False)
+    elif path.endswith('.jsonl'):
+        reader = pd.read_json(path, lines=True, chunksize=chunk_size, dtype=False)
+    else:
+        raise ValueError(f"Unsupported profile format: {path}")
+    for chunk in reader:
+        yield chunk.reset_index(drop=True)
+
+
+def normalize_profiles(chunk):
+    """Give a chunk of profiles the same types the API's user details have"""
+    profiles = pd.DataFrame(index=chunk.index)
+    for name in ('disease', 'gender', 'skinType'):
+        profiles[name] = chunk[name].fillna('').astype(str) if name in chunk else ''
+    age = pd.to_numeric(chunk['age'], errors='coerce') if 'age' in chunk else pd.Series(0, index=chunk.index)
+    profiles['age'] = age.fillna(0).astype(int)
+
+    def parse_allergies(value):
+        if isinstance(value, (list, tuple, np.ndarray)):
+            return tuple(str(a) for a in value)
+        if value is None or (isinstance(value, float) and np.isnan(value)) or value == '':
+            return ()
+        return tuple(str(value).split(','))
+
+    allergies = chunk['allergies'] if 'allergies' in chunk else pd.Series([()] * len(chunk), index=chunk.index)
+    profiles['allergies'] = allergies.map(parse_allergies)
+    return profiles
+
+
+def json_value(value):
+    """A raw input value as a plain Python value json.dumps can write
+
+    Columns missing from a JSONL row come back as NaN, which json.dumps would
+    write as a bare (invalid) NaN, so missing values become null.
+    """
+    if isinstance(value, np.ndarray):
+        return [json_value(v) for v in value.tolist()]
+    if isinstance(value, (list, tuple)):
+        return [json_value(v) for v in value]
+    if isinstance(value, dict):
+        return {k: json_value(v) for k, v in value.items()}
+    if pd.isna(value):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def group_keys(profiles):
+    """Key each profile by everything its recommendations depend on
+
+    Recommendations only depend on the disease, skin type, which side of
+    the 18 and 60 age thresholds the user is on, and the allergies.
+    """
+    age_bracket = np.select([profiles['age'] < 18, profiles['age'] > 60], [0, 2], default=1)
+    return pd.DataFrame({
+        'disease': profiles['disease'],
+        'skinType': profiles['skinType'].str.lower(),
+        'age_bracket': age_bracket,
+        'allergies': profiles['allergies'].map('\x1f'.join),
+    })
+
+
+def score_chunk(chunk):
+    """Score one chunk of raw profile rows and return its output lines"""
+    profiles = normalize_profiles(chunk)
+    keys = group_keys(profiles)
+    group_ids = keys.groupby(list(keys.columns), sort=False).ngroup().to_numpy()
+    _, first_rows = np.unique(group_ids, return_index=True)
+
+    encoded = {}
+    for group_id, row in enumerate(first_rows):
+        key = tuple(keys.iloc[row])
+        if key not in _scored_groups:
+            profile = profiles.iloc[row]
+            user_details = {
+                'age': int(profile['age']),
+                'gender': profile['gender'],
+                'skinType': profile['skinType'],
+                'allergies': list(profile['allergies']),
+            }
+            if len(_scored_groups) >= MAX_SCORED_GROUPS:
+                _scored_groups.clear()
+            result = _recommender.get_recommendations(profile['disease'], user_details)
+            # Encoded without its closing brace so profile fields can be appended
+            _scored_groups[key] = json.dumps(result)[:-1]
+        encoded[group_id] = _scored_groups[key]
+
+    columns = list(chunk.columns)
+    lines = []
+    for values, group_id in zip(zip(*(chunk[c].tolist() for c in columns)), group_ids):
+        profile = json.dumps({c: json_value(v) for c, v in zip(columns, values)}, default=str)[1:]
+        lines.append(f"{encoded[group_id]}, {profile}\n" if len(profile) > 1 else f"{encoded[group_id]}}}\n")
+    return ''.join(lines)
+
+
+def _init_worker(catalog_path):
+    global _recommender
+    if _recommender is None:
+        _recommender = SkinCareRecommender(catalog_path=catalog_path)
+
+
+def score_profiles(input_path, output_path, chunk_size=10000, workers=None, catalog_path=None):
+    """Score every profile in input_path and write JSONL results to output_path
+
+    Returns the number of profiles scored.
+    """
+    global _recommender
+    workers = workers or os.cpu_count() or 1
+    # Built once here so forked workers share the catalog instead of rebuilding it
+    _recommender = SkinCareRecommender(catalog_path=catalog_path)
+
+    scored = 0
+    with open(output_path, 'w') as out:
+        if workers == 1:
+            for chunk in read_profiles(input_path, chunk_size):
+                out.write(score_chunk(chunk))
+                scored += len(chunk)
+            return scored
+
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(catalog_path,)) as pool:
+            pending = deque()
+            for chunk in read_profiles(input_path, chunk_size):
+                pending.append((len(chunk), pool.apply_async(score_chunk, (chunk,))))
+                # Bound memory: write finished chunks before reading too far ahead
+                while len(pending) >= 2 * workers:
+                    size, result = pending.popleft()
+                    out.write(result.get())
+                    scored += size
+            while pending:
+                size, result = pending.popleft()
+                out.write(result.get())
+                scored += size
+    return scored
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='CSV or JSONL file of profiles')
+    parser.add_argument('output', help='JSONL file to write recommendations to')
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes (1 disables the pool)')
+    parser.add_argument('--catalog', help='Product catalog file (defaults to the built-in catalog)')
+    args = parser.parse_args()
+
+    scored = score_profiles(args.input, args.output, args.chunk_size, args.workers, args.catalog)
+    print(f"Scored {scored} profiles")
+
+
+if __name__ == '__main__':
+    main()
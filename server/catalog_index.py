@@ -0,0 +1,272 @@
+import numpy as np
+import pandas as pd
+
+# Columns every catalog source must provide
+CATALOG_COLUMNS = ['id', 'name', 'image_url', 'description', 'disease',
+                   'ingredients', 'skin_types', 'age_range', 'tags']
+# Age ranges a product may be used for by users under 18
+CHILD_AGE_RANGES = {'all', 'child'}
+# Upper bound on cached substring lookups across all vocabularies
+MAX_CACHED_LOOKUPS = 4096
+# Rebuild from scratch once this fraction of rows are deleted or superseded
+COMPACT_DEAD_FRACTION = 0.25
+
+
+def sorted_isin(rows, sorted_rows):
+    """np.isin(rows, sorted_rows) for a non-empty sorted `sorted_rows`, without sorting it again"""
+    positions = np.minimum(np.searchsorted(sorted_rows, rows), len(sorted_rows) - 1)
+    return sorted_rows[positions] == rows
+
+
+def split_terms(value, separator=','):
+    """Split a catalog field like 'dry, sensitive' into normalized terms"""
+    return [term.strip().lower() for term in str(value).split(separator) if term.strip()]
+
+
+class CatalogIndex:
+    """Precomputed lookup structures over the product catalog.
+
+    Products are stored column-wise in arrays addressed by row number, and
+    every filter in recommend_products becomes a set or bitmask operation:
+
+    - disease term -> sorted array of rows (posting list)
+    - skin types -> one bit per skin-type term, ``skin_bits[row]``
+    - age ranges -> ``child_ok[row]`` for products suitable for under 18s
+    - ingredient term -> sorted array of rows (inverted index)
+
+    Query terms are matched as substrings of the indexed terms, like the
+    ``str.contains`` filters this replaces; the vocabulary scan for each
+    distinct query term is done once and cached.
+
+    An index is never modified once built. ``apply_changes`` returns a new
+    index that shares every posting list the change doesn't touch: updated
+    and added products are appended as new rows, and deleted or superseded
+    rows are marked dead in ``alive`` and skipped by every lookup.
+    """
+
+    def __init__(self, products_df):
+        self.columns = {name: products_df[name].to_numpy(dtype=object) for name in CATALOG_COLUMNS}
+        self.ids = products_df['id'].to_numpy(dtype=np.int64)
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        self.row_by_id = {int(product_id): row for row, product_id in enumerate(self.ids)}
+
+        self.disease_postings = {}
+        self.ingredient_postings = {}
+        self.skin_type_bits = {}
+        self.skin_bits = np.zeros(0, dtype=np.uint64)
+        self.child_ok = np.zeros(0, dtype=bool)
+        self._index_rows(0, products_df)
+
+        self._lookup_cache = {}
+
+    def __len__(self):
+        return int(self.alive.sum())
+
+    @property
+    def names(self):
+        return self.columns['name']
+
+    @property
+    def image_urls(self):
+        return self.columns['image_url']
+
+    @property
+    def descriptions(self):
+        return self.columns['description']
+
+    def _index_rows(self, first_row, products_df):
+        """Add posting lists, skin-type bits and age flags for appended rows"""
+        self._extend_postings(self.disease_postings, first_row, products_df['disease'])
+        self._extend_postings(self.ingredient_postings, first_row, products_df['ingredients'])
+
+        skin_bits = np.zeros(len(products_df), dtype=np.uint64)
+        for i, value in enumerate(products_df['skin_types']):
+            for term in split_terms(value):
+                if term not in self.skin_type_bits:
+                    if len(self.skin_type_bits) == 64:
+                        raise ValueError("Catalog has more than 64 distinct skin types")
+                    self.skin_type_bits[term] = np.uint64(1) << np.uint64(len(self.skin_type_bits))
+                skin_bits[i] |= self.skin_type_bits[term]
+        self.skin_bits = np.concatenate([self.skin_bits, skin_bits])
+
+        age_ranges = products_df['age_range'].astype(str).str.strip().str.lower()
+        self.child_ok = np.concatenate([self.child_ok, age_ranges.isin(CHILD_AGE_RANGES).to_numpy()])
+
+    @staticmethod
+    def _extend_postings(postings, first_row, column):
+        """Append rows to the posting lists of their terms
+
+        Appended rows are numbered after every existing row, so the lists
+        stay sorted. Only the lists of terms that occur are replaced.
+        """
+        added = {}
+        for i, value in enumerate(column):
+            for term in split_terms(value):
+                added.setdefault(term, []).append(first_row + i)
+        for term, rows in added.items():
+            rows = np.array(rows, dtype=np.int64)
+            existing = postings.get(term)
+            postings[term] = rows if existing is None else np.concatenate([existing, rows])
+
+    def apply_changes(self, upserts_df=None, deleted_ids=()):
+        """Return (new index, appended rows, removed rows) for a catalog change
+
+        Products in `upserts_df` whose id already exists replace the old
+        version. The caller should rebuild from ``to_dataframe()`` instead
+        once ``needs_compaction()`` is true.
+        """
+        if upserts_df is None:
+            upserts_df = pd.DataFrame(columns=CATALOG_COLUMNS)
+
+        new = object.__new__(CatalogIndex)
+        new.disease_postings = dict(self.disease_postings)
+        new.ingredient_postings = dict(self.ingredient_postings)
+        new.skin_type_bits = dict(self.skin_type_bits)
+        new.skin_bits = self.skin_bits
+        new.child_ok = self.child_ok
+        new.row_by_id = dict(self.row_by_id)
+        new._lookup_cache = {}
+
+        first_row = len(self.ids)
+        upsert_ids = upserts_df['id'].to_numpy(dtype=np.int64)
+        new.columns = {name: np.concatenate([self.columns[name], upserts_df[name].to_numpy(dtype=object)])
+                       for name in CATALOG_COLUMNS}
+        new.ids = np.concatenate([self.ids, upsert_ids])
+        new.alive = np.concatenate([self.alive, np.ones(len(upsert_ids), dtype=bool)])
+
+        removed = []
+        for product_id in deleted_ids:
+            row = new.row_by_id.pop(int(product_id), None)
+            if row is not None:
+                removed.append(row)
+        for i, product_id in enumerate(upsert_ids):
+            # A later row for the same id (even within this change) wins
+            row = new.row_by_id.get(int(product_id))
+            if row is not None:
+                removed.append(row)
+            new.row_by_id[int(product_id)] = first_row + i
+        removed_rows = np.array(sorted(removed), dtype=np.int64)
+        new.alive[removed_rows] = False
+        new._index_rows(first_row, upserts_df)
+
+        appended_rows = np.arange(first_row, len(new.ids), dtype=np.int64)
+        appended_rows = appended_rows[new.alive[appended_rows]]
+        return new, appended_rows, removed_rows
+
+    def needs_compaction(self):
+        return len(self.ids) > 0 and 1 - self.alive.mean() > COMPACT_DEAD_FRACTION
+
+    def to_dataframe(self):
+        """The live catalog, in row order"""
+        rows = np.flatnonzero(self.alive)
+        df = pd.DataFrame({name: self.columns[name][rows] for name in CATALOG_COLUMNS})
+        df['id'] = df['id'].astype(np.int64)
+        return df
+
+    def _matching_terms(self, vocabulary_name, vocabulary, query):
+        """Indexed terms that contain `query`, cached per query"""
+        cache_key = (vocabulary_name, query)
+        terms = self._lookup_cache.get(cache_key)
+        if terms is None:
+            terms = [t for t in vocabulary if query in t]
+            if len(self._lookup_cache) >= MAX_CACHED_LOOKUPS:
+                self._lookup_cache.clear()
+            self._lookup_cache[cache_key] = terms
+        return terms
+
+    def _rows_for(self, vocabulary_name, postings, query):
+        terms = self._matching_terms(vocabulary_name, postings, query)
+        if not terms:
+            return np.empty(0, dtype=np.int64)
+        rows = self._union([postings[t] for t in terms])
+        return rows[self.alive[rows]]
+
+    def _union(self, row_lists):
+        """Sorted union of posting lists, marked in a row mask rather than sorted"""
+        if len(row_lists) == 1:
+            # A posting list is already sorted and unique
+            return row_lists[0]
+        mask = np.zeros(len(self.ids), dtype=bool)
+        for rows in row_lists:
+            mask[rows] = True
+        return np.flatnonzero(mask)
+
+    def disease_rows(self, disease):
+        """Rows of products indicated for `disease`"""
+        return self._rows_for('disease', self.disease_postings, disease.strip().lower())
+
+    def skin_type_mask(self, skin_type):
+        """Bitmask of the skin-type terms matching `skin_type`"""
+        mask = np.uint64(0)
+        for term in self._matching_terms('skin_type', self.skin_type_bits, skin_type.strip().lower()):
+            mask |= self.skin_type_bits[term]
+        return mask
+
+    def allergen_rows(self, allergens):
+        """Rows of products containing any of `allergens` as an ingredient"""
+        rows = [self._rows_for('ingredient', self.ingredient_postings, a.strip().lower())
+                for a in allergens if a.strip()]
+        rows = [r for r in rows if len(r)]
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+        return self._union(rows)
+
+    def filter_rows(self, rows, skin_type='', age=30, allergies=()):
+        """Apply the profile filters to candidate rows
+
+        Like the original DataFrame filters, each filter is skipped when it
+        would leave no products.
+        """
+        if skin_type:
+            matching = rows[(self.skin_bits[rows] & self.skin_type_mask(skin_type)) != 0]
+            if len(matching):
+                rows = matching
+
+        if age < 18:
+            age_appropriate = rows[self.child_ok[rows]]
+            if len(age_appropriate):
+                rows = age_appropriate
+
+        if allergies:
+            excluded = self.allergen_rows(allergies)
+            if len(excluded):
+                is_excluded = np.zeros(len(self.ids), dtype=bool)
+                is_excluded[excluded] = True
+                allergen_free = rows[~is_excluded[rows]]
+                if len(allergen_free):
+                    rows = allergen_free
+
+        return rows
+
+    def first_allergen_free(self, rows, k, allergies):
+        """The first k of `rows` that contain none of `allergies`
+
+        Like filter_rows, every row is kept when none is allergen-free. Rows
+        must be live; they are checked a chunk at a time, so this usually
+        stops within the first chunk instead of filtering all of them.
+        """
+        postings = [self.ingredient_postings[term] for allergen in allergies if allergen.strip()
+                    for term in self._matching_terms('ingredient', self.ingredient_postings,
+                                                     allergen.strip().lower())]
+        if not postings:
+            return rows[:k]
+
+        found = []
+        start, chunk = 0, max(64, 8 * k)
+        while start < len(rows) and len(found) < k:
+            block = rows[start:start + chunk]
+            contains_allergen = np.any([sorted_isin(block, rows_with) for rows_with in postings], axis=0)
+            found.extend(block[~contains_allergen][:k - len(found)])
+            start, chunk = start + chunk, 2 * chunk
+        return np.array(found, dtype=np.int64) if found else rows[:k]
+
+    def format_products(self, rows):
+        """Format product rows for the API response"""
+        return [
+            {
+                "name": self.names[row],
+                "imageUrl": self.image_urls[row],
+                "description": self.descriptions[row]
+            }
+            for row in rows
+        ]
@@ -0,0 +1,97 @@
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from catalog_index import CATALOG_COLUMNS
+
+
+def load_catalog(path):
+    """Load a product catalog from a CSV, JSON/JSONL or SQLite file
+
+    SQLite databases must have a `products` table with the catalog columns.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    elif extension == '.jsonl':
+        df = pd.read_json(path, lines=True, dtype=False)
+    elif extension == '.json':
+        with open(path) as f:
+            df = pd.DataFrame(json.load(f))
+    elif extension in ('.db', '.sqlite', '.sqlite3'):
+        with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as conn:
+            df = pd.read_sql_query(f"SELECT {', '.join(CATALOG_COLUMNS)} FROM products", conn)
+    else:
+        raise ValueError(f"Unsupported catalog format: {path}")
+    return normalize_catalog(df)
+
+
+def normalize_catalog(df):
+    """Check a catalog has every column and give the columns consistent types"""
+    missing = [name for name in CATALOG_COLUMNS if name not in df.columns]
+    if missing:
+        raise ValueError(f"Catalog is missing columns: {', '.join(missing)}")
+
+    df = df[CATALOG_COLUMNS].copy()
+    df['id'] = df['id'].astype(np.int64)
+    for name in CATALOG_COLUMNS[1:]:
+        df[name] = df[name].fillna('').astype(str)
+    if df['id'].duplicated().any():
+        raise ValueError("Catalog has duplicate product ids")
+    return df.reset_index(drop=True)
+
+
+def diff_catalogs(old_df, new_df):
+    """Return (upserts, deleted ids) that turn old_df into new_df"""
+    old = old_df.set_index('id')[CATALOG_COLUMNS[1:]]
+    new = new_df.set_index('id')[CATALOG_COLUMNS[1:]]
+
+    deleted_ids = old.index.difference(new.index).tolist()
+    common = new.index.intersection(old.index)
+    changed = (new.loc[common] != old.loc[common]).any(axis=1)
+    upsert_ids = new.index.difference(old.index).union(changed[changed].index)
+
+    upserts = new.loc[new.index.isin(upsert_ids)].reset_index()
+    return upserts[CATALOG_COLUMNS], deleted_ids
+
+
+class CatalogWatcher:
+    """Polls a catalog file and hot-reloads the recommender when it changes"""
+
+    def __init__(self, recommender, path, interval_seconds=30):
+        self.recommender = recommender
+        self.path = path
+        self.interval_seconds = interval_seconds
+        self._last_mtime = self._mtime()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='catalog-watcher', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            mtime = self._mtime()
+            if mtime is None or mtime == self._last_mtime:
+                continue
+            try:
+                upserts, deleted_ids = self.recommender.reload_catalog(self.path)
+                self._last_mtime = mtime
+                print(f"Catalog reloaded: {upserts} upserted, {deleted_ids} deleted")
+            except Exception as e:
+                # Keep serving the previous catalog and retry on the next poll
+                print(f"Error reloading catalog: {e}")
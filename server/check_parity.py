@@ -0,0 +1,86 @@
+"""Compare a TFLite backend against the Keras model on a set of sample images
+
+Usage:
+    python check_parity.py --images samples/ --backend tflite-int8
+
+Reports top-1 agreement, confidence drift on the Keras top-1 class, and
+per-image latency for both backends. Exits non-zero if agreement falls
+below --min-agreement.
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+import imaging
+from imaging import list_images
+from inference import DEFAULT_MODEL_PATHS, load_backend
+
+
+def run_backend(backend, batches):
+    """Predict every batch and return (scores, seconds per image)"""
+    backend.predict(batches[0])  # Warm up before timing
+    outputs = []
+    start = time.perf_counter()
+    for batch in batches:
+        outputs.append(backend.predict(batch))
+    elapsed = time.perf_counter() - start
+    scores = np.concatenate(outputs, axis=0)
+    return scores, elapsed / len(scores)
+
+
+def compare(reference_scores, candidate_scores):
+    reference_top1 = np.argmax(reference_scores, axis=1)
+    candidate_top1 = np.argmax(candidate_scores, axis=1)
+    rows = np.arange(len(reference_scores))
+    drift = np.abs(candidate_scores[rows, reference_top1] - reference_scores[rows, reference_top1])
+    return {
+        'images': int(len(reference_scores)),
+        'top1_agreement': float(np.mean(reference_top1 == candidate_top1)),
+        'confidence_drift_mean': float(np.mean(drift)),
+        'confidence_drift_p95': float(np.percentile(drift, 95)),
+        'confidence_drift_max': float(np.max(drift)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', required=True, help='Directory of sample images')
+    parser.add_argument('--backend', default='tflite-int8', choices=['tflite-fp16', 'tflite-int8'])
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATHS['keras'], help='Reference Keras model')
+    parser.add_argument('--tflite-model', help='TFLite file to check (defaults to the backend default)')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--limit', type=int, help='Maximum number of images to use')
+    parser.add_argument('--min-agreement', type=float, default=0.0)
+    args = parser.parse_args()
+
+    paths = list_images(args.images, args.limit)
+    if not paths:
+        parser.error(f"No images found in {args.images}")
+
+    images = np.concatenate([imaging.preprocess_image(path) for path in paths], axis=0)
+    batches = [images[i:i + args.batch_size] for i in range(0, len(images), args.batch_size)]
+
+    reference = load_backend('keras', imaging.TARGET_SIZE, model_path=args.model)
+    candidate = load_backend(args.backend, imaging.TARGET_SIZE, model_path=args.tflite_model)
+
+    reference_scores, reference_latency = run_backend(reference, batches)
+    candidate_scores, candidate_latency = run_backend(candidate, batches)
+
+    report = compare(reference_scores, candidate_scores)
+    report.update({
+        'backend': args.backend,
+        'batch_size': args.batch_size,
+        'keras_ms_per_image': reference_latency * 1000,
+        'candidate_ms_per_image': candidate_latency * 1000,
+    })
+    print(json.dumps(report, indent=2))
+
+    if report['top1_agreement'] < args.min_agreement:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
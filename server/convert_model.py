@@ -0,0 +1,73 @@
+"""Convert the Keras disease model into TFLite backends for inference.py
+
+Usage:
+    python convert_model.py --model model.h5 --calibration-dir samples/
+
+Writes model_fp16.tflite (float16 weights) and model_int8.tflite (int8
+weights and activations, calibrated on the images in --calibration-dir).
+"""
+import argparse
+import os
+
+import tensorflow as tf
+
+import imaging
+from imaging import list_images
+from inference import DEFAULT_MODEL_PATHS, KerasBackend
+
+
+def convert_fp16(model):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+    return converter.convert()
+
+
+def convert_int8(model, calibration_images):
+    def representative_dataset():
+        for path in calibration_images:
+            yield [imaging.preprocess_image(path).astype('float32')]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    # Keep float input/output so the backend can be swapped without touching preprocessing
+    converter.inference_input_type = tf.float32
+    converter.inference_output_type = tf.float32
+    return converter.convert()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATHS['keras'], help='Keras model to convert')
+    parser.add_argument('--out-dir', default='.', help='Directory to write the .tflite files to')
+    parser.add_argument('--variants', nargs='+', choices=['fp16', 'int8'], default=['fp16', 'int8'])
+    parser.add_argument('--calibration-dir', help='Sample images used to calibrate int8 quantization')
+    parser.add_argument('--calibration-limit', type=int, default=200,
+                        help='Maximum number of calibration images to use')
+    args = parser.parse_args()
+
+    if 'int8' in args.variants and not args.calibration_dir:
+        parser.error('--calibration-dir is required for the int8 variant')
+
+    model = KerasBackend(args.model, imaging.TARGET_SIZE).model
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    for variant in args.variants:
+        if variant == 'fp16':
+            tflite_model = convert_fp16(model)
+        else:
+            calibration_images = list_images(args.calibration_dir, args.calibration_limit)
+            if not calibration_images:
+                parser.error(f"No images found in {args.calibration_dir}")
+            tflite_model = convert_int8(model, calibration_images)
+
+        out_path = os.path.join(args.out_dir, os.path.basename(DEFAULT_MODEL_PATHS[f'tflite-{variant}']))
+        with open(out_path, 'wb') as f:
+            f.write(tflite_model)
+        print(f"Wrote {out_path} ({len(tflite_model) / 1024:.0f} KiB)")
+
+
+if __name__ == '__main__':
+    main()
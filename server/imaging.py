@@ -0,0 +1,71 @@
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+TARGET_SIZE = (128, 128)  # Input size the disease model was trained on
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+# Larger images are rejected from their header, before any pixel is decoded
+MAX_IMAGE_PIXELS = 50_000_000
+
+
+class ImageTooLarge(ValueError):
+    """Raised for images with more pixels than allowed"""
+
+
+def list_images(directory, limit=None):
+    """Sorted image paths in a directory (recursively)"""
+    paths = []
+    for dirpath, _, filenames in os.walk(directory):
+        for name in filenames:
+            if name.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS:
+                paths.append(os.path.join(dirpath, name))
+    paths.sort()
+    return paths[:limit] if limit else paths
+
+
+def load_image_array(img_source, target_size=TARGET_SIZE, max_pixels=MAX_IMAGE_PIXELS, fast_decode=True):
+    """Decode an image into a (1, H, W, 3) float array of raw pixel values
+
+    img_source is either a path on disk or the raw bytes of an upload.
+    Matches keras' image.load_img/img_to_array (RGB, nearest-neighbour
+    resize) without importing TensorFlow.
+
+    With fast_decode, JPEGs are decoded straight to the smallest DCT scale
+    (1/2, 1/4 or 1/8) that is still at least target_size, which skips most
+    of the inverse DCT and colour conversion and never holds the
+    full-resolution bitmap in memory. The pixels then differ slightly from
+    a full-size decode. Raises ImageTooLarge for images over max_pixels
+    without decoding them.
+    """
+    if isinstance(img_source, (bytes, bytearray)):
+        img_source = io.BytesIO(img_source)
+    try:
+        img = Image.open(img_source)
+    except Image.DecompressionBombError as e:
+        # PIL refuses images over twice its own limit before our check runs
+        raise ImageTooLarge(str(e)) from e
+    with img:
+        width, height = img.size
+        if max_pixels and width * height > max_pixels:
+            raise ImageTooLarge(f"Image has {width * height} pixels (max {max_pixels})")
+        width_height = (target_size[1], target_size[0])
+        if fast_decode and img.format == 'JPEG':
+            img.draft('RGB', width_height)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        if img.size != width_height:
+            img = img.resize(width_height, Image.NEAREST)
+        img_array = np.asarray(img, dtype=np.float32)
+    return np.expand_dims(img_array, axis=0)
+
+
+def preprocess_input(img_array):
+    """Scale pixels to [-1, 1] like mobilenet_v2.preprocess_input"""
+    return img_array / 127.5 - 1.0
+
+
+def preprocess_image(img_source, target_size=TARGET_SIZE, **decode_options):
+    """Decode an image and scale it the way the model expects"""
+    return preprocess_input(load_image_array(img_source, target_size, **decode_options))
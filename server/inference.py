@@ -0,0 +1,157 @@
+import threading
+
+import numpy as np
+
+# Model file each backend loads by default, relative to the server directory
+DEFAULT_MODEL_PATHS = {
+    'keras': 'model.h5',
+    'tflite-fp16': 'model_fp16.tflite',
+    'tflite-int8': 'model_int8.tflite',
+}
+
+
+def configure_tensorflow_threads(intra_op_threads=None, inter_op_threads=None):
+    """Size TensorFlow's thread pools; only possible before TF runs anything
+
+    Left unset, each process starts one thread per core for each pool,
+    which oversubscribes the CPU when several workers share a machine.
+    """
+    import tensorflow as tf
+
+    try:
+        if intra_op_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        if inter_op_threads:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    except RuntimeError as e:
+        print(f"Warning: could not configure TensorFlow threads: {e}")
+
+
+def padded_batch_size(size):
+    """Round a batch size up to a power of two, so few shapes get compiled"""
+    return 1 << (size - 1).bit_length()
+
+
+class KerasBackend:
+    """Runs the original Keras model through a compiled tf.function
+
+    The function is traced once for a (None, H, W, 3) float32 input, so it
+    skips the per-call dataset and callback setup of Model.predict. With
+    jit_compile, XLA compiles it once per batch shape; batches are then
+    padded to a power of two to keep the number of shapes small.
+    """
+
+    name = 'keras'
+
+    def __init__(self, model_path, target_size, jit_compile=False):
+        import tensorflow as tf
+
+        # Load the model
+        loaded = tf.keras.models.load_model(model_path)
+        # Rebuild the model to ensure correct input shape, keeping the trained weights
+        self.model = tf.keras.models.model_from_json(loaded.to_json())
+        self.model.build((None, *target_size, 3))
+        self.model.set_weights(loaded.get_weights())
+        self.input_shape = self.model.input_shape
+
+        self.jit_compile = jit_compile
+        self._predict = tf.function(
+            lambda batch: self.model(batch, training=False),
+            input_signature=[tf.TensorSpec((None, *target_size, 3), tf.float32)],
+            jit_compile=jit_compile,
+        )
+
+    def predict(self, batch):
+        """Return class probabilities for an (N, H, W, 3) batch"""
+        batch = np.asarray(batch, dtype=np.float32)
+        size = len(batch)
+        if self.jit_compile and padded_batch_size(size) != size:
+            padding = np.zeros((padded_batch_size(size) - size, *batch.shape[1:]), dtype=np.float32)
+            batch = np.concatenate([batch, padding])
+        return self._predict(batch).numpy()[:size]
+
+    def warm_up(self, batch_sizes=(1,)):
+        """Trace and run the model once per batch size so requests don't pay for it"""
+        for size in batch_sizes:
+            self.predict(np.zeros((size, *self.input_shape[1:]), dtype=np.float32))
+
+
+class TFLiteBackend:
+    """Runs a converted (float16 or int8 quantized) TFLite model
+
+    Uses a standalone interpreter (ai_edge_litert or tflite_runtime) when one
+    is installed, which avoids importing TensorFlow at all, and falls back to
+    tf.lite otherwise.
+    """
+
+    def __init__(self, model_path, name='tflite', num_threads=None):
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tflite_runtime.interpreter import Interpreter
+            except ImportError:
+                import tensorflow as tf
+                Interpreter = tf.lite.Interpreter
+
+        self.name = name
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self.input_shape = (None, *(int(dim) for dim in self._input['shape'][1:]))
+        self._batch_size = int(self._input['shape'][0])
+        # The interpreter holds per-call state, so only one batch may run at a time
+        self._lock = threading.Lock()
+
+    def warm_up(self, batch_sizes=(1,)):
+        """Run the model once so tensors are allocated before the first request"""
+        # Every batch size reallocates the tensors, so only the first is worth it
+        self.predict(np.zeros((batch_sizes[0] if batch_sizes else 1, *self.input_shape[1:]), dtype=np.float32))
+
+    def predict(self, batch):
+        """Return class probabilities for an (N, H, W, 3) batch"""
+        batch = self._quantize(batch, self._input)
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self.interpreter.resize_tensor_input(self._input['index'], batch.shape)
+                self.interpreter.allocate_tensors()
+                self._batch_size = batch.shape[0]
+            self.interpreter.set_tensor(self._input['index'], batch)
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self._output['index'])
+        return self._dequantize(output, self._output)
+
+    @staticmethod
+    def _quantize(batch, details):
+        if details['dtype'] == np.float32:
+            return batch.astype(np.float32, copy=False)
+        scale, zero_point = details['quantization']
+        info = np.iinfo(details['dtype'])
+        quantized = np.round(batch / scale + zero_point)
+        return np.clip(quantized, info.min, info.max).astype(details['dtype'])
+
+    @staticmethod
+    def _dequantize(output, details):
+        if details['dtype'] == np.float32:
+            return output
+        scale, zero_point = details['quantization']
+        return (output.astype(np.float32) - zero_point) * scale
+
+
+def load_backend(name, target_size, model_path=None, num_threads=None, inter_op_threads=None,
+                 jit_compile=False):
+    """Create the inference backend called `name` (see DEFAULT_MODEL_PATHS)
+
+    num_threads sets the threads one inference may use (TensorFlow's
+    intra-op pool or the TFLite interpreter's threads); inter_op_threads
+    and jit_compile only apply to the Keras backend.
+    """
+    if name not in DEFAULT_MODEL_PATHS:
+        raise ValueError(f"Unknown inference backend: {name}")
+
+    model_path = model_path or DEFAULT_MODEL_PATHS[name]
+    if name == 'keras':
+        configure_tensorflow_threads(num_threads, inter_op_threads)
+        return KerasBackend(model_path, target_size, jit_compile=jit_compile)
+    return TFLiteBackend(model_path, name=name, num_threads=num_threads)
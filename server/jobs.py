@@ -0,0 +1,221 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+from admission import QueueFull
+
+# Job states; a job is finished once it is DONE or FAILED
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+FINISHED = {DONE, FAILED}
+
+
+class JobStore:
+    """Job records kept in memory, dropped `ttl_seconds` after they finish
+
+    A record is a dict with jobId, status, createdAt and updatedAt, plus
+    result (DONE) or error (FAILED). Records that stay unfinished for
+    `stale_seconds` (their worker died) are dropped too. Only the process
+    that ran a job can see it; use DiskJobStore when several workers serve
+    the API.
+    """
+
+    def __init__(self, ttl_seconds=600, stale_seconds=3600):
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self._jobs = {}
+        self._changed = threading.Condition()
+        self._last_sweep = 0
+
+    def put(self, job):
+        with self._changed:
+            self._jobs[job['jobId']] = job
+            self._changed.notify_all()
+        self._maybe_sweep()
+
+    def _maybe_sweep(self):
+        # Sweeping looks at every record; do it at most once per second
+        if time.time() - self._last_sweep > 1:
+            self._last_sweep = time.time()
+            self.sweep()
+
+    def delete(self, job_id):
+        with self._changed:
+            self._jobs.pop(job_id, None)
+
+    def get(self, job_id):
+        with self._changed:
+            job = self._jobs.get(job_id)
+        if job is not None and self._expired(job):
+            return None
+        return job
+
+    def wait(self, job_id, status, timeout):
+        """The job once its status is no longer `status`, or after `timeout` seconds"""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                job = self._jobs.get(job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job['status'] != status or remaining <= 0:
+                    return job
+                self._changed.wait(remaining)
+
+    def sweep(self):
+        with self._changed:
+            for job_id in [job_id for job_id, job in self._jobs.items() if self._expired(job)]:
+                del self._jobs[job_id]
+
+    def _expired(self, job):
+        age = time.time() - job['updatedAt']
+        return age > (self.ttl_seconds if job['status'] in FINISHED else self.stale_seconds)
+
+
+class DiskJobStore(JobStore):
+    """Job records kept as JSON files, so any process can answer for any job"""
+
+    # How often wait() re-reads a job file
+    POLL_SECONDS = 0.1
+
+    def __init__(self, root, ttl_seconds=600, stale_seconds=3600):
+        super().__init__(ttl_seconds, stale_seconds)
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, job_id):
+        return os.path.join(self.root, f"{job_id}.json")
+
+    def put(self, job):
+        path = self._path(job['jobId'])
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, path)
+        self._maybe_sweep()
+
+    def delete(self, job_id):
+        try:
+            os.remove(self._path(job_id))
+        except OSError:
+            pass
+
+    def get(self, job_id):
+        # Job ids are generated hex strings; refuse anything that could be a path
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._path(job_id)) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return None if self._expired(job) else job
+
+    def wait(self, job_id, status, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job['status'] != status or time.monotonic() >= deadline:
+                return job
+            time.sleep(self.POLL_SECONDS)
+
+    def sweep(self):
+        for name in os.listdir(self.root):
+            if name.endswith('.json') and self.get(name[:-5]) is None:
+                try:
+                    os.remove(os.path.join(self.root, name))
+                except OSError:
+                    pass
+
+
+class JobQueue:
+    """In-process queue of jobs drained by a pool of worker threads
+
+    `submit` returns a job id immediately; a worker later calls
+    ``run_fn(*args)`` and records the result (or the error message) in the
+    store. At most `max_queued` jobs wait, holding at most
+    `max_queued_bytes` of bytes arguments between them; beyond either limit
+    submit raises QueueFull, so a burst is absorbed up to a known memory
+    bound.
+    """
+
+    def __init__(self, run_fn, store, workers=4, max_queued=256, max_queued_bytes=None):
+        self.run_fn = run_fn
+        self.store = store
+        self.workers = workers
+        self.max_queued_bytes = max_queued_bytes
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+        self._worker_pid = None
+        self._queued_bytes = 0
+        # Jobs queued and running now, and finished so far, in this process
+        self._counts = dict.fromkeys((QUEUED, RUNNING, DONE, FAILED), 0)
+
+    def queue_depth(self):
+        """Number of jobs waiting for a worker"""
+        return self._queue.qsize()
+
+    def queued_bytes(self):
+        """Bytes arguments held by jobs waiting for a worker"""
+        return self._queued_bytes
+
+    def counts(self):
+        """Jobs queued and running in this process, and how many it has finished"""
+        with self._lock:
+            return dict(self._counts)
+
+    def submit(self, *args):
+        self._ensure_workers()
+        size = sum(len(arg) for arg in args if isinstance(arg, bytes))
+        with self._lock:
+            if self.max_queued_bytes is not None and self._queued_bytes + size > self.max_queued_bytes:
+                raise QueueFull()
+            self._queued_bytes += size
+            self._counts[QUEUED] += 1
+
+        now = time.time()
+        job = {'jobId': uuid.uuid4().hex, 'status': QUEUED, 'createdAt': now, 'updatedAt': now}
+        try:
+            # Recorded before a worker can pick it up, so its updates come after this
+            self.store.put(dict(job))
+            self._queue.put_nowait((job, args, size))
+        except Exception as e:
+            with self._lock:
+                self._queued_bytes -= size
+                self._counts[QUEUED] -= 1
+            if not isinstance(e, queue.Full):
+                raise
+            self.store.delete(job['jobId'])
+            raise QueueFull()
+        return job['jobId']
+
+    def _ensure_workers(self):
+        # Threads do not survive fork(), so (re)start the pool lazily in
+        # whichever process first submits a job
+        pid = os.getpid()
+        if self._worker_pid == pid:
+            return
+        with self._lock:
+            if self._worker_pid != pid:
+                for i in range(self.workers):
+                    threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True).start()
+                self._worker_pid = pid
+
+    def _run(self):
+        while True:
+            job, args, size = self._queue.get()
+            with self._lock:
+                self._queued_bytes -= size
+                self._counts[QUEUED] -= 1
+                self._counts[RUNNING] += 1
+            self.store.put({**job, 'status': RUNNING, 'updatedAt': time.time()})
+            try:
+                finished = {'status': DONE, 'result': self.run_fn(*args)}
+            except Exception as e:
+                print("Error:", str(e))
+                finished = {'status': FAILED, 'error': str(e)}
+            self.store.put({**job, **finished, 'updatedAt': time.time()})
+            with self._lock:
+                self._counts[RUNNING] -= 1
+                self._counts[finished['status']] += 1
@@ -0,0 +1,198 @@
+"""Load generator for /api/analyze
+
+Usage:
+    python load_test.py --url http://localhost:5000 --concurrency 16 --duration 30
+    python load_test.py --images samples/ --requests 2000 --output load.json
+
+Runs `concurrency` closed-loop clients, each posting an image and a user
+profile as soon as its previous request completes, and reports throughput
+and latency percentiles as JSON. Images come from --images, or are
+generated; with --unique every request sends a different image so the
+prediction cache cannot answer it. Requests are sent with urllib, so no
+HTTP client library is needed on the machine generating load.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+import numpy as np
+
+from benchmark import git_commit, synthetic_image
+from imaging import list_images
+
+PROFILE = {'name': 'Load Test', 'age': '35', 'gender': 'female', 'skinType': 'dry', 'allergies': 'fragrance'}
+
+
+def encode_multipart(fields, filename, data):
+    """Body and content type of a multipart/form-data upload"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    content_type = 'image/png' if filename.endswith('.png') else 'image/jpeg'
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="{filename}"\r\n'
+                 f'Content-Type: {content_type}\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def load_images(args):
+    """(filename, bytes) pairs to upload"""
+    if args.images:
+        images = []
+        for path in list_images(args.images, args.limit):
+            with open(path, 'rb') as f:
+                images.append((os.path.basename(path), f.read()))
+        return images
+    count = args.requests + args.warmup if args.unique else args.limit or 32
+    return [(f'synthetic{seed}.jpg', synthetic_image(args.width, args.height, seed=seed)) for seed in range(count)]
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {}
+    latencies = np.array(latencies) * 1000
+    return {
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'mean_ms': float(latencies.mean()),
+        'max_ms': float(latencies.max()),
+    }
+
+
+class LoadGenerator:
+    def __init__(self, url, images, concurrency, duration=None, total_requests=None, timeout=60):
+        self.url = url.rstrip('/') + '/api/analyze'
+        self.images = images
+        self.concurrency = concurrency
+        self.duration = duration
+        self.total_requests = total_requests
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._issued = 0
+        self.latencies = []  # Successful requests only
+        self.statuses = {}
+
+    def _next_request(self, deadline):
+        with self._lock:
+            if self.total_requests is not None and self._issued >= self.total_requests:
+                return None
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            self._issued += 1
+            return self._issued - 1
+
+    def _send(self, number):
+        filename, data = self.images[number % len(self.images)]
+        body, content_type = encode_multipart(PROFILE, filename, data)
+        req = urllib.request.Request(self.url, data=body, headers={'Content-Type': content_type})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except (urllib.error.URLError, OSError) as e:
+            status = type(e).__name__
+        return status, time.perf_counter() - start
+
+    def _client(self, deadline):
+        while True:
+            number = self._next_request(deadline)
+            if number is None:
+                return
+            status, latency = self._send(number)
+            with self._lock:
+                self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+                if status == 200:
+                    self.latencies.append(latency)
+
+    def run(self):
+        start = time.perf_counter()
+        deadline = start + self.duration if self.duration else None
+        clients = [threading.Thread(target=self._client, args=(deadline,), daemon=True)
+                   for _ in range(self.concurrency)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - start
+
+        return {
+            'requests': sum(self.statuses.values()),
+            'successful': len(self.latencies),
+            'seconds': elapsed,
+            'throughput_rps': len(self.latencies) / elapsed if elapsed else 0.0,
+            'statuses': self.statuses,
+            'latency': percentiles(self.latencies),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, help='Seconds to run (default 30 unless --requests is given)')
+    parser.add_argument('--requests', type=int, help='Total requests to send')
+    parser.add_argument('--warmup', type=int, default=10, help='Requests sent before measuring')
+    parser.add_argument('--images', help='Directory of images to upload')
+    parser.add_argument('--limit', type=int, help='Maximum number of images to use')
+    parser.add_argument('--unique', action='store_true', help='Generate a different image for every request')
+    parser.add_argument('--width', type=int, default=640, help='Width of generated images')
+    parser.add_argument('--height', type=int, default=480, help='Height of generated images')
+    parser.add_argument('--timeout', type=float, default=60, help='Client timeout per request in seconds')
+    parser.add_argument('--output', help='Write the report here instead of stdout')
+    args = parser.parse_args()
+    if args.duration is None and args.requests is None:
+        args.duration = 30
+    if args.unique and args.images:
+        parser.error("--unique generates its images; don't combine it with --images")
+    if args.unique and not args.requests:
+        parser.error("--unique needs --requests to know how many images to generate")
+
+    images = load_images(args)
+    if not images:
+        parser.error(f"No images found in {args.images}")
+
+    warmup_images = images
+    if args.unique:
+        # Warm up on images of its own so none of the measured ones are cached
+        images, warmup_images = images[:args.requests], images[args.requests:]
+    if args.warmup:
+        LoadGenerator(args.url, warmup_images, min(args.concurrency, args.warmup),
+                      total_requests=args.warmup, timeout=args.timeout).run()
+
+    report = LoadGenerator(args.url, images, args.concurrency, duration=args.duration,
+                           total_requests=args.requests, timeout=args.timeout).run()
+    report['config'] = {
+        'url': args.url,
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        'images': len(images),
+        'unique': args.unique,
+        'commit': git_commit(),
+        'client_platform': platform.platform(),
+        'client_cpu_count': os.cpu_count(),
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    if not report['successful']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
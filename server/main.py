@@ -1,80 +1,391 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
 import numpy as np
+import io
 import os
-import tensorflow as tf
-from tensorflow.keras.preprocessing import image
-from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
+import uuid
 import json
+import zipfile
+import threading
+import time
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
-from recommendation import SkinCareRecommender
+from admission import BoundedExecutor, QueueFull
+from jobs import FINISHED, QUEUED, DiskJobStore, JobQueue, JobStore
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from batching import BatchPredictor
+from upload_store import UploadStore
+from inference import load_backend
+from prediction_cache import PredictionCache
+from metrics import (registry, REQUESTS, ERRORS, IN_FLIGHT, REQUEST_SECONDS, STAGE_SECONDS,
+                     MODEL_BATCH_SIZE, MODEL_PREDICT_SECONDS)
+from profiler import profiler
+import imaging
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
 # Configuration
+# With FAST_START the model and recommender load on a background thread, so
+# /api/health and /api/diseases answer immediately and /api/ready reports
+# when analysis can be served. Otherwise they load before the app is served.
+FAST_START = os.environ.get('DERMIQ_FAST_START', '0') == '1'
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
-TARGET_SIZE = (128, 128)  # Updated to match model's expected input size
+TARGET_SIZE = imaging.TARGET_SIZE  # Updated to match model's expected input size
+# Which inference backend runs the model: 'keras' (model.h5), 'tflite-fp16'
+# or 'tflite-int8' (produced offline by convert_model.py)
+INFERENCE_BACKEND = os.environ.get('DERMIQ_INFERENCE_BACKEND', 'keras')
+MODEL_PATH = os.environ.get('DERMIQ_MODEL_PATH')  # Overrides the backend's default file
+# Skip the model in load_resources(); serve.py sets this for the Keras backend
+# and has each worker call load_model_in_worker() after fork instead
+DEFER_MODEL_LOAD = os.environ.get('DERMIQ_DEFER_MODEL_LOAD', '0') == '1'
+# Concurrent /api/analyze requests are grouped into one model call of up to
+# MAX_BATCH_SIZE images, waiting at most MAX_BATCH_WAIT_MS for a batch to fill
+MAX_BATCH_SIZE = int(os.environ.get('DERMIQ_MAX_BATCH_SIZE', 16))
+MAX_BATCH_WAIT_MS = float(os.environ.get('DERMIQ_MAX_BATCH_WAIT_MS', 5))
+# Threads one model call may use (TensorFlow's intra-op pool, or the TFLite
+# interpreter's threads) and TensorFlow's inter-op pool. Unset means one per
+# core per process; serve.py splits the cores between its workers instead.
+INTRA_OP_THREADS = int(os.environ.get('DERMIQ_INTRA_OP_THREADS', 0)) or None
+INTER_OP_THREADS = int(os.environ.get('DERMIQ_INTER_OP_THREADS', 0)) or None
+# Compile the Keras model with XLA
+JIT_COMPILE = os.environ.get('DERMIQ_JIT_COMPILE', '0') == '1'
+# Batch sizes run once at startup so no request pays for tracing or compiling
+# them; by default every power of two up to MAX_BATCH_SIZE, rounded up
+WARMUP_BATCH_SIZES = [int(size) for size in os.environ.get(
+    'DERMIQ_WARMUP_BATCH_SIZES',
+    ','.join(str(1 << i) for i in range((MAX_BATCH_SIZE - 1).bit_length() + 1))
+).split(',') if size]
+
+# 'memory' decodes uploads straight from the request; 'disk' saves them to
+# UPLOAD_FOLDER first and reads them back (the original behaviour), deleting
+# each file once it has been analyzed
+UPLOAD_MODE = os.environ.get('DERMIQ_UPLOAD_MODE', 'memory')
+# In memory mode, originals can still be kept in a content-addressed store
+# written in the background, capped at UPLOAD_STORE_MAX_BYTES across every
+# worker process (checked against the directory once a minute)
+PERSIST_UPLOADS = os.environ.get('DERMIQ_PERSIST_UPLOADS', '0') == '1'
+UPLOAD_STORE_MAX_BYTES = int(os.environ.get('DERMIQ_UPLOAD_STORE_MAX_BYTES', 1024 ** 3))
+
+# Images over MAX_UPLOAD_BYTES are answered with 413 before they are decoded
+# (from Content-Length when the client sends it), and images over
+# MAX_IMAGE_PIXELS from their header alone. JPEGs are decoded at a reduced
+# DCT scale close to TARGET_SIZE unless FAST_JPEG_DECODE is off.
+MAX_UPLOAD_BYTES = int(os.environ.get('DERMIQ_MAX_UPLOAD_BYTES', 20 * 1024 ** 2))
+MAX_IMAGE_PIXELS = int(os.environ.get('DERMIQ_MAX_IMAGE_PIXELS', imaging.MAX_IMAGE_PIXELS))
+FAST_JPEG_DECODE = os.environ.get('DERMIQ_FAST_JPEG_DECODE', '1') == '1'
+# Room for the profile fields and multipart headers around an upload
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+# Predictions are cached by image content so re-submitted photos skip the model.
+# Mode 'exact' matches identical pixels after resizing, 'perceptual' also
+# matches near-duplicates within PREDICTION_CACHE_MAX_DISTANCE bits of dHash.
+# Set PREDICTION_CACHE_ENTRIES to 0 to disable the cache.
+PREDICTION_CACHE_ENTRIES = int(os.environ.get('DERMIQ_PREDICTION_CACHE_ENTRIES', 10000))
+PREDICTION_CACHE_BYTES = int(os.environ.get('DERMIQ_PREDICTION_CACHE_BYTES', 16 * 1024 ** 2))
+PREDICTION_CACHE_TTL = float(os.environ.get('DERMIQ_PREDICTION_CACHE_TTL', 3600))
+PREDICTION_CACHE_MODE = os.environ.get('DERMIQ_PREDICTION_CACHE_MODE', 'exact')
+PREDICTION_CACHE_MAX_DISTANCE = int(os.environ.get('DERMIQ_PREDICTION_CACHE_MAX_DISTANCE', 0))
+
+# Product catalog file (CSV, JSON/JSONL or SQLite); the built-in catalog is
+# used when unset. The file is checked for changes every CATALOG_RELOAD_SECONDS
+# and only the changed products are re-indexed (0 disables reloading).
+CATALOG_PATH = os.environ.get('DERMIQ_CATALOG_PATH')
+CATALOG_RELOAD_SECONDS = float(os.environ.get('DERMIQ_CATALOG_RELOAD_SECONDS', 30))
+# Don't watch the catalog from load_resources(); serve.py sets this so only
+# the forked workers, which serve it, watch it (see serve.post_fork)
+DEFER_CATALOG_WATCHER = os.environ.get('DERMIQ_DEFER_CATALOG_WATCHER', '0') == '1'
+# Recommended products are cached per normalized profile (disease, skin type,
+# age bracket, allergens) until the catalog changes; 0 disables the cache
+RECOMMENDATION_CACHE_ENTRIES = int(os.environ.get('DERMIQ_RECOMMENDATION_CACHE_ENTRIES', 4096))
+
+# Inference runs on at most INFERENCE_WORKERS threads per process with at most
+# INFERENCE_QUEUE_DEPTH requests waiting; beyond that requests get a 429 with
+# Retry-After instead of queueing. Each analysis may take REQUEST_TIMEOUT seconds.
+INFERENCE_WORKERS = int(os.environ.get('DERMIQ_INFERENCE_WORKERS', MAX_BATCH_SIZE))
+INFERENCE_QUEUE_DEPTH = int(os.environ.get('DERMIQ_INFERENCE_QUEUE_DEPTH', 2 * MAX_BATCH_SIZE))
+REQUEST_TIMEOUT = float(os.environ.get('DERMIQ_REQUEST_TIMEOUT', 30))
+RETRY_AFTER_SECONDS = int(os.environ.get('DERMIQ_RETRY_AFTER_SECONDS', 1))
+
+# /api/analyze/batch runs inference on BATCH_CHUNK_SIZE images at a time and
+# accepts at most BATCH_MAX_IMAGES images (files or zip entries) per request
+BATCH_CHUNK_SIZE = int(os.environ.get('DERMIQ_BATCH_CHUNK_SIZE', 32))
+BATCH_MAX_IMAGES = int(os.environ.get('DERMIQ_BATCH_MAX_IMAGES', 500))
+BATCH_MAX_ENTRY_BYTES = int(os.environ.get('DERMIQ_BATCH_MAX_ENTRY_BYTES', MAX_UPLOAD_BYTES))
+BATCH_MAX_REQUEST_BYTES = int(os.environ.get('DERMIQ_BATCH_MAX_REQUEST_BYTES', 256 * 1024 ** 2))
+
+# /api/jobs queues analyses for JOB_WORKERS threads per process, holding at most
+# JOB_QUEUE_DEPTH waiting uploads, and at most JOB_QUEUE_MAX_BYTES of them, in
+# memory; each running job holds one more upload (up to MAX_UPLOAD_BYTES).
+# Results are kept JOB_RESULT_TTL seconds after they finish, in memory or,
+# with JOB_STORE_DIR set, as files any worker process can read (needed with
+# several serve.py workers). Records of jobs left unfinished by a worker that
+# died are dropped JOB_STALE_SECONDS after their last update.
+JOB_WORKERS = int(os.environ.get('DERMIQ_JOB_WORKERS', MAX_BATCH_SIZE))
+JOB_QUEUE_DEPTH = int(os.environ.get('DERMIQ_JOB_QUEUE_DEPTH', 256))
+JOB_QUEUE_MAX_BYTES = int(os.environ.get('DERMIQ_JOB_QUEUE_MAX_BYTES', 256 * 1024 ** 2))
+JOB_RESULT_TTL = float(os.environ.get('DERMIQ_JOB_RESULT_TTL', 600))
+JOB_STALE_SECONDS = float(os.environ.get('DERMIQ_JOB_STALE_SECONDS', 3600))
+JOB_STORE_DIR = os.environ.get('DERMIQ_JOB_STORE_DIR')
+JOB_EVENTS_KEEPALIVE_SECONDS = 15
+
+# Exposes /api/profiler, which switches a sampling profiler on and off at
+# runtime and returns collapsed stacks for flame graphs
+PROFILER_ENDPOINT = os.environ.get('DERMIQ_PROFILER_ENDPOINT', '0') == '1'
 
 # Create uploads directory if it doesn't exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+if UPLOAD_MODE == 'disk':
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+# Hard cap on any request body; /api/analyze checks its own, smaller limit
+app.config['MAX_CONTENT_LENGTH'] = max(BATCH_MAX_REQUEST_BYTES, MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES)
+
+upload_store = None
+if UPLOAD_MODE == 'memory' and PERSIST_UPLOADS:
+    upload_store = UploadStore(UPLOAD_FOLDER, max_bytes=UPLOAD_STORE_MAX_BYTES)
+
+# The model, recommender and catalog watcher are set up by load_resources().
+# Their imports (TensorFlow, pandas, scikit-learn) happen there too, so that
+# importing this module stays fast.
+inference_backend = None
+model_loaded = False
+model_status = 'loading'  # Then the backend name, or 'mock' if the model failed to load
+recommender = None
+catalog_watcher = None
+resources_ready = threading.Event()
+resources_error = None
+
+def run_model_batch(batch):
+    """Run the model on a batch, recording its size and duration"""
+    MODEL_BATCH_SIZE.observe(len(batch))
+    with MODEL_PREDICT_SECONDS.time():
+        return inference_backend.predict(batch)
+
+# Batch concurrent predictions into a single call on the model
+batch_predictor = BatchPredictor(
+    run_model_batch,
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait_ms=MAX_BATCH_WAIT_MS
+)
+
+prediction_cache = None
+if PREDICTION_CACHE_ENTRIES > 0:
+    prediction_cache = PredictionCache(
+        max_entries=PREDICTION_CACHE_ENTRIES,
+        max_bytes=PREDICTION_CACHE_BYTES,
+        ttl_seconds=PREDICTION_CACHE_TTL,
+        mode=PREDICTION_CACHE_MODE,
+        max_distance=PREDICTION_CACHE_MAX_DISTANCE
+    )
+
+inference_executor = BoundedExecutor(INFERENCE_WORKERS, INFERENCE_QUEUE_DEPTH)
 
-# Load the disease detection model
-try:
-    # Load the model
-    disease_model = tf.keras.models.load_model('model.h5')
-    # Rebuild the model to ensure correct input shape
-    disease_model = tf.keras.models.model_from_json(disease_model.to_json())
-    disease_model.build((None, *TARGET_SIZE, 3))
-    model_loaded = True
-    print("Model loaded successfully with input shape:", disease_model.input_shape)
-except Exception as e:
-    print(f"Error loading model: {e}")
-    print("Warning: Running in development mode with mock predictions.")
-    model_loaded = False
-
-# Initialize the recommendation system
-recommender = SkinCareRecommender()
+if JOB_STORE_DIR:
+    job_store = DiskJobStore(JOB_STORE_DIR, ttl_seconds=JOB_RESULT_TTL, stale_seconds=JOB_STALE_SECONDS)
+else:
+    job_store = JobStore(ttl_seconds=JOB_RESULT_TTL, stale_seconds=JOB_STALE_SECONDS)
+# analyze_image is defined further down, so look it up when a job runs
+job_queue = JobQueue(lambda img_source, user_details: analyze_image(img_source, user_details), job_store,
+                     workers=JOB_WORKERS, max_queued=JOB_QUEUE_DEPTH, max_queued_bytes=JOB_QUEUE_MAX_BYTES)
+
+# Queue and cache state is read when /api/metrics is scraped
+registry.gauge('dermiq_batch_queue_depth', 'Images waiting to be batched',
+               callback=lambda: [({}, batch_predictor.queue_depth())])
+registry.gauge('dermiq_inference_in_flight', 'Analyses running or queued in the inference pool',
+               callback=lambda: [({}, inference_executor.in_flight)])
+registry.gauge('dermiq_job_queue_depth', 'Jobs waiting for a job worker in this process',
+               callback=lambda: [({}, job_queue.queue_depth())])
+registry.gauge('dermiq_job_queue_bytes', 'Upload bytes held by jobs waiting in this process',
+               callback=lambda: [({}, job_queue.queued_bytes())])
+registry.gauge('dermiq_jobs', 'Jobs queued or running in this process', ['status'],
+               callback=lambda: [({'status': status}, count) for status, count in job_queue.counts().items()
+                                 if status not in FINISHED])
+registry.counter('dermiq_jobs_finished_total', 'Jobs finished by this process', ['status'],
+                 callback=lambda: [({'status': status}, count) for status, count in job_queue.counts().items()
+                                   if status in FINISHED])
+if prediction_cache is not None:
+    registry.gauge('dermiq_prediction_cache_entries', 'Predictions held in the cache',
+                   callback=lambda: [({}, prediction_cache.stats()['entries'])])
+    registry.counter('dermiq_prediction_cache_events_total', 'Prediction cache lookups and removals', ['event'],
+                     callback=lambda: [({'event': event}, count) for event, count in prediction_cache.stats().items()
+                                       if event in ('hits', 'misses', 'evictions', 'expirations')])
+registry.counter('dermiq_recommendation_cache_events_total', 'Recommendation cache lookups', ['event'],
+                 callback=lambda: [({'event': event}, count) for event, count in recommender.cache_stats().items()
+                                   if event in ('hits', 'misses')] if recommender is not None else [])
+
+def load_model():
+    """Load the disease detection model and run a warm-up inference"""
+    global inference_backend, model_loaded, model_status
+    try:
+        inference_backend = load_backend(INFERENCE_BACKEND, TARGET_SIZE, model_path=MODEL_PATH,
+                                         num_threads=INTRA_OP_THREADS, inter_op_threads=INTER_OP_THREADS,
+                                         jit_compile=JIT_COMPILE)
+        # The first inference per batch size pays for tracing and allocation; do it now
+        inference_backend.warm_up(WARMUP_BATCH_SIZES)
+        model_loaded = True
+        model_status = inference_backend.name
+        print(f"Model loaded successfully ({inference_backend.name}) with input shape:", inference_backend.input_shape)
+    except Exception as e:
+        print(f"Error loading model: {e}")
+        print("Warning: Running in development mode with mock predictions.")
+        model_loaded = False
+        model_status = 'mock'
+
+def load_recommender():
+    """Initialize the recommendation system"""
+    global recommender
+    from recommendation import SkinCareRecommender
+    recommender = SkinCareRecommender(catalog_path=CATALOG_PATH, cache_size=RECOMMENDATION_CACHE_ENTRIES)
+
+def start_catalog_watcher():
+    """Watch the catalog file from this process (call again after fork)"""
+    global catalog_watcher
+    if CATALOG_PATH and CATALOG_RELOAD_SECONDS > 0:
+        from catalog_store import CatalogWatcher
+        catalog_watcher = CatalogWatcher(recommender, CATALOG_PATH, CATALOG_RELOAD_SECONDS).start()
+
+def load_resources():
+    """Load everything /api/analyze needs, then mark the server ready"""
+    global resources_error
+    try:
+        if not DEFER_MODEL_LOAD:
+            load_model()
+        load_recommender()
+        if not DEFER_CATALOG_WATCHER:
+            start_catalog_watcher()
+        resources_ready.set()
+    except Exception as e:
+        resources_error = str(e)
+        print(f"Error loading resources: {e}")
+
+def load_model_in_worker():
+    """Load a deferred model in this (forked) process; analysis answers 503 until it is ready"""
+    resources_ready.clear()
+    def load():
+        load_model()
+        resources_ready.set()
+    threading.Thread(target=load, name='model-loader', daemon=True).start()
+
+if FAST_START:
+    threading.Thread(target=load_resources, name='resource-loader', daemon=True).start()
+else:
+    load_resources()
 
 # Define the disease classes that your model was trained on
 disease_classes = ["Psoriasis", "Ringworm", "Shingles", "Vitiligo", "Eczema"]
 
 # Helper functions
+def overloaded_response():
+    """429 response telling the client when to retry"""
+    response = jsonify({'error': 'Server is busy, please retry shortly'})
+    response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+    return response, 429
+
+def not_ready_response():
+    """503 response while the model and recommender are still loading"""
+    response = jsonify({'error': 'Server is starting up, please retry shortly'})
+    response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+    return response, 503
+
+def too_large_response(message):
+    return jsonify({'error': message}), 413
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(_error):
+    return too_large_response('Request is too large')
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def preprocess_image(img_path):
-    """Preprocess the image for the model"""
-    img = image.load_img(img_path, target_size=TARGET_SIZE)
-    img_array = image.img_to_array(img)
-    img_array = np.expand_dims(img_array, axis=0)
-    img_array = preprocess_input(img_array)
-    return img_array
+def upload_size(file):
+    """Size in bytes of an uploaded file, which werkzeug has already spooled"""
+    file.stream.seek(0, os.SEEK_END)
+    size = file.stream.tell()
+    file.stream.seek(0)
+    return size
 
-def predict_disease(img_path):
-    """Predict the skin disease from an image"""
-    if not model_loaded:
-        # Mock prediction for development
-        predicted_class_index = np.random.randint(0, len(disease_classes))
-        confidence = round(np.random.uniform(0.7, 0.99), 2)
-        
-        return {
-            'disease': disease_classes[predicted_class_index],
-            'confidence': confidence
-        }
+def discard_upload(img_source):
+    """Delete an upload saved in disk mode once it is no longer needed"""
+    if UPLOAD_MODE == 'disk':
+        try:
+            os.remove(img_source)
+        except OSError:
+            pass
+
+def decode_image(img_source):
+    """Decode an image into raw (1, H, W, 3) pixels, enforcing the pixel limit"""
+    return imaging.load_image_array(img_source, TARGET_SIZE, max_pixels=MAX_IMAGE_PIXELS,
+                                    fast_decode=FAST_JPEG_DECODE)
+
+def preprocess_image(img_source):
+    """Preprocess the image for the model
+
+    img_source is either a path on disk or the raw bytes of an upload.
+    """
+    return imaging.preprocess_input(decode_image(img_source))
+
+def mock_prediction():
+    """Random prediction used when no model is loaded (development mode)"""
+    predicted_class_index = np.random.randint(0, len(disease_classes))
+    confidence = round(np.random.uniform(0.7, 0.99), 2)
     
-    processed_img = preprocess_image(img_path)
-    predictions = disease_model.predict(processed_img)
-    predicted_class_index = np.argmax(predictions[0])
-    confidence = float(predictions[0][predicted_class_index])
+    return {
+        'disease': disease_classes[predicted_class_index],
+        'confidence': confidence
+    }
+
+def scores_to_prediction(scores):
+    """Turn one row of class probabilities into a prediction result"""
+    predicted_class_index = int(np.argmax(scores))
+    confidence = float(scores[predicted_class_index])
     
     return {
         'disease': disease_classes[predicted_class_index],
         'confidence': confidence
     }
 
+def predict_disease(img_source):
+    """Predict the skin disease from an image"""
+    if not model_loaded:
+        # Mock prediction for development
+        return mock_prediction()
+    
+    with STAGE_SECONDS.time(stage='decode'):
+        pixels = decode_image(img_source)
+    if prediction_cache is not None:
+        with STAGE_SECONDS.time(stage='cache'):
+            cached = prediction_cache.get(pixels)
+        if cached is not None:
+            return cached
+
+    with STAGE_SECONDS.time(stage='predict'):
+        scores = batch_predictor.predict(imaging.preprocess_input(pixels))
+    result = scores_to_prediction(scores)
+    if prediction_cache is not None:
+        prediction_cache.put(pixels, result)
+    return result
+
+def predict_disease_batch(pixel_arrays):
+    """Predict a list of decoded (1, H, W, 3) images with a single model call"""
+    if not model_loaded:
+        return [mock_prediction() for _ in pixel_arrays]
+
+    results = [None] * len(pixel_arrays)
+    if prediction_cache is not None:
+        for i, pixels in enumerate(pixel_arrays):
+            results[i] = prediction_cache.get(pixels)
+
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        batch = imaging.preprocess_input(np.concatenate([pixel_arrays[i] for i in missing], axis=0))
+        scores = run_model_batch(batch)
+        for row, i in enumerate(missing):
+            results[i] = scores_to_prediction(scores[row])
+            if prediction_cache is not None:
+                prediction_cache.put(pixel_arrays[i], results[i])
+    return results
+
 def get_disease_info(disease_name):
     """Get information about the disease"""
     disease_info = {
@@ -101,56 +412,364 @@ def get_disease_info(disease_name):
     }
     return disease_info.get(disease_name, {"description": "Information not available", "symptoms": []})
 
-@app.route('/api/analyze', methods=['POST'])
-def analyze_skin():
+def parse_user_details(fields):
+    """Build the user profile from form fields or a JSON object"""
+    allergies = fields.get('allergies') or []
+    if isinstance(allergies, str):
+        allergies = allergies.split(',')
+    
+    return {
+        'name': fields.get('name', ''),
+        'age': int(fields.get('age', 0) or 0),
+        'gender': fields.get('gender', ''),
+        'skinType': fields.get('skinType', ''),
+        'allergies': allergies
+    }
+
+def build_analysis_response(prediction_result, user_details):
+    """Combine a prediction with disease info and personalized recommendations"""
+    disease_name = prediction_result['disease']
+    disease_info = get_disease_info(disease_name)
+    with STAGE_SECONDS.time(stage='recommend'):
+        recommendations = recommender.get_recommendations(disease_name, user_details)
+    
+    return {
+        'disease': disease_name,
+        'confidence': prediction_result['confidence'],
+        'description': disease_info['description'],
+        'symptoms': disease_info['symptoms'],
+        'remedies': recommendations['remedies'],
+        'products': recommendations['products'],
+        'userDetails': user_details
+    }
+
+def analyze_image(img_source, user_details):
+    """Run the whole analysis for one image (used by the job workers)"""
+    try:
+        return build_analysis_response(predict_disease(img_source), user_details)
+    finally:
+        discard_upload(img_source)
+
+def invalid_profile_response(img_source, error):
+    """400 for a request whose profile fields don't parse, dropping its upload"""
+    discard_upload(img_source)
+    return jsonify({'error': f"Invalid profile: {error}"}), 400
+
+def receive_image():
+    """Validate and read the 'image' upload of the current request
+
+    Returns (img_source, None), or (None, error response) when the upload
+    is missing, of the wrong type or too large.
+    """
+    # Reject oversized uploads before reading the body
+    if request.content_length and request.content_length > MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES:
+        return None, too_large_response(f"Image is too large (max {MAX_UPLOAD_BYTES} bytes)")
+    
     if 'image' not in request.files:
-        return jsonify({'error': 'No image part'}), 400
+        return None, (jsonify({'error': 'No image part'}), 400)
     
     file = request.files['image']
     if file.filename == '':
-        return jsonify({'error': 'No selected file'}), 400
+        return None, (jsonify({'error': 'No selected file'}), 400)
+    
+    if not allowed_file(file.filename):
+        return None, (jsonify({'error': 'Invalid file type'}), 400)
     
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+    if upload_size(file) > MAX_UPLOAD_BYTES:
+        return None, too_large_response(f"Image is too large (max {MAX_UPLOAD_BYTES} bytes)")
+    
+    with STAGE_SECONDS.time(stage='upload'):
+        if UPLOAD_MODE == 'disk':
+            # Prefix with a random id so concurrent uploads of the same name don't clash
+            filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
+            img_source = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            file.save(img_source)
+        else:
+            img_source = file.read()
+            if upload_store is not None:
+                upload_store.put(img_source, file.filename.rsplit('.', 1)[1])
+    return img_source, None
+
+@app.route('/api/analyze', methods=['POST'])
+def analyze_skin():
+    if not resources_ready.is_set():
+        return not_ready_response()
+    
+    img_source, error_response = receive_image()
+    if error_response is not None:
+        return error_response
+    
+    try:
+        user_details = parse_user_details(request.form)
+    except ValueError as e:
+        return invalid_profile_response(img_source, e)
+    
+    try:
+        prediction_result = inference_executor.run(predict_disease, img_source, timeout=REQUEST_TIMEOUT)
+        response = build_analysis_response(prediction_result, user_details)
         
-        user_details = {
-            'name': request.form.get('name', ''),
-            'age': int(request.form.get('age', 0)),
-            'gender': request.form.get('gender', ''),
-            'skinType': request.form.get('skinType', ''),
-            'allergies': request.form.get('allergies', '').split(',') if request.form.get('allergies') else []
-        }
+        with STAGE_SECONDS.time(stage='serialize'):
+            return jsonify(response), 200
         
+    except QueueFull:
+        return overloaded_response()
+    except imaging.ImageTooLarge as e:
+        return too_large_response(str(e))
+    except FutureTimeoutError:
+        ERRORS.inc(endpoint='analyze_skin')
+        return jsonify({'error': 'Analysis timed out'}), 504
+    except Exception as e:
+        print("Error:", str(e))
+        ERRORS.inc(endpoint='analyze_skin')
+        return jsonify({'error': str(e)}), 500
+    finally:
+        discard_upload(img_source)
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Queue an analysis and answer 202 with its job id straight away
+
+    Takes the same fields as /api/analyze. Poll /api/jobs/<id> or listen to
+    /api/jobs/<id>/events for the result.
+    """
+    if not resources_ready.is_set():
+        return not_ready_response()
+    
+    img_source, error_response = receive_image()
+    if error_response is not None:
+        return error_response
+    
+    try:
+        user_details = parse_user_details(request.form)
+    except ValueError as e:
+        return invalid_profile_response(img_source, e)
+    
+    try:
+        job_id = job_queue.submit(img_source, user_details)
+    except QueueFull:
+        discard_upload(img_source)
+        return overloaded_response()
+    except Exception:
+        discard_upload(img_source)
+        raise
+    
+    response = jsonify({
+        'jobId': job_id,
+        'status': QUEUED,
+        'statusUrl': f"/api/jobs/{job_id}",
+        'eventsUrl': f"/api/jobs/{job_id}/events"
+    })
+    response.headers['Location'] = f"/api/jobs/{job_id}"
+    return response, 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify(job), 200
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-sent events for a job: one event per status change, named
+    after the status, ending with 'done' or 'failed' (which carries the job)"""
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    
+    def generate(job):
+        last_status = None
+        while True:
+            if job['status'] != last_status:
+                yield f"event: {job['status']}\ndata: {json.dumps(job)}\n\n"
+                last_status = job['status']
+            else:
+                yield ": keep-alive\n\n"
+            if job['status'] in FINISHED:
+                return
+            job = job_store.wait(job_id, last_status, JOB_EVENTS_KEEPALIVE_SECONDS)
+            if job is None:
+                yield "event: expired\ndata: {}\n\n"
+                return
+    
+    response = Response(generate(job), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Don't let a proxy hold events back
+    return response
+
+def collect_batch_images():
+    """List (filename, read) pairs for every image in a batch request
+
+    Images come from repeated 'images' file fields and/or a zip in 'archive'.
+    Uploaded files are read up front, since they are closed once the view
+    returns; zip entries are only decompressed when `read` is called.
+    """
+    items = []
+    for file in request.files.getlist('images'):
+        if file.filename and allowed_file(file.filename):
+            if upload_size(file) > BATCH_MAX_ENTRY_BYTES:
+                raise ValueError(f"Image too large: {file.filename}")
+            items.append((file.filename, lambda data=file.read(): data))
+
+    archive = request.files.get('archive')
+    if archive is not None and archive.filename:
+        zf = zipfile.ZipFile(io.BytesIO(archive.read()))
+        for info in sorted(zf.infolist(), key=lambda info: info.filename):
+            if info.is_dir() or not allowed_file(info.filename):
+                continue
+            if info.file_size > BATCH_MAX_ENTRY_BYTES:
+                raise ValueError(f"Archive entry too large: {info.filename}")
+            items.append((info.filename, lambda name=info.filename: zf.read(name)))
+    return items
+
+def analyze_batch_chunk(chunk, profiles, offset):
+    """Analyze one chunk of images and return one result dict per image"""
+    results = [None] * len(chunk)
+    decoded, pixel_arrays = [], []
+    for i, (filename, read) in enumerate(chunk):
         try:
-            prediction_result = predict_disease(filepath)
-            disease_name = prediction_result['disease']
-            disease_info = get_disease_info(disease_name)
-            recommendations = recommender.get_recommendations(disease_name, user_details)
-            
-            response = {
-                'disease': disease_name,
-                'confidence': prediction_result['confidence'],
-                'description': disease_info['description'],
-                'symptoms': disease_info['symptoms'],
-                'remedies': recommendations['remedies'],
-                'products': recommendations['products'],
-                'userDetails': user_details
-            }
-            
-            return jsonify(response), 200
-            
+            with STAGE_SECONDS.time(stage='decode'):
+                pixel_arrays.append(decode_image(read()))
+            decoded.append(i)
         except Exception as e:
-            print("Error:", str(e))
-            return jsonify({'error': str(e)}), 500
+            results[i] = {'error': f"Could not decode image: {e}"}
+
+    with STAGE_SECONDS.time(stage='predict'):
+        predictions = predict_disease_batch(pixel_arrays) if pixel_arrays else []
+    for i, prediction_result in zip(decoded, predictions):
+        results[i] = build_analysis_response(prediction_result, profiles[offset + i])
+
+    for i, (filename, _) in enumerate(chunk):
+        results[i] = {'index': offset + i, 'filename': filename, **results[i]}
+    return results
+
+@app.route('/api/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """Analyze many images in one request, streaming NDJSON results per chunk
+
+    Accepts files in repeated 'images' fields and/or a zip in 'archive'. The
+    profile fields apply to every image, unless 'profiles' holds a JSON list
+    with one profile per image (in upload order, zip entries sorted by name).
+    """
+    if not resources_ready.is_set():
+        return not_ready_response()
+    
+    try:
+        items = collect_batch_images()
+    except (zipfile.BadZipFile, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not items:
+        return jsonify({'error': 'No valid images'}), 400
+    if len(items) > BATCH_MAX_IMAGES:
+        return jsonify({'error': f"Too many images (max {BATCH_MAX_IMAGES})"}), 400
     
-    return jsonify({'error': 'Invalid file type'}), 400
+    try:
+        if request.form.get('profiles'):
+            profiles = [parse_user_details(profile) for profile in json.loads(request.form['profiles'])]
+            if len(profiles) != len(items):
+                return jsonify({'error': 'profiles must contain one entry per image'}), 400
+        else:
+            profiles = [parse_user_details(request.form)] * len(items)
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({'error': f"Invalid profiles: {e}"}), 400
+    
+    # The stream runs the model on this thread, so it holds an inference slot
+    # until it is closed; shed the batch up front if none is free
+    try:
+        inference_executor.reserve()
+    except QueueFull:
+        return overloaded_response()
+    
+    def generate():
+        for offset in range(0, len(items), BATCH_CHUNK_SIZE):
+            chunk = items[offset:offset + BATCH_CHUNK_SIZE]
+            try:
+                results = analyze_batch_chunk(chunk, profiles, offset)
+            except Exception as e:
+                print("Error:", str(e))
+                ERRORS.inc(endpoint='analyze_batch')
+                results = [{'index': offset + i, 'filename': filename, 'error': str(e)}
+                           for i, (filename, _) in enumerate(chunk)]
+            yield ''.join(json.dumps(result) + '\n' for result in results)
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # Called by the server once the stream ends or the client goes away,
+    # including when the generator never started
+    response.call_on_close(inference_executor.release)
+    return response
+
+def endpoint_label():
+    return request.endpoint or 'unmatched'
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    IN_FLIGHT.inc(endpoint=endpoint_label())
+
+@app.after_request
+def record_request_metrics(response):
+    # Streamed responses are counted when their headers are sent
+    REQUESTS.inc(endpoint=endpoint_label(), status=response.status_code)
+    REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=endpoint_label())
+    return response
+
+@app.teardown_request
+def finish_request(_error):
+    # stream_with_context pushes the request context again, so streamed
+    # responses are torn down twice; only the first teardown counts
+    if g.pop('request_start', None) is not None:
+        IN_FLIGHT.dec(endpoint=endpoint_label())
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint (values are per worker process)"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+if PROFILER_ENDPOINT:
+    @app.route('/api/profiler', methods=['GET', 'POST'])
+    def profiler_control():
+        """GET returns the collapsed stacks sampled so far; POST with
+        {"enabled": bool, "intervalMs": n, "reset": bool} switches sampling"""
+        if request.method == 'GET':
+            return Response(profiler.collapsed(), mimetype='text/plain')
+        
+        options = request.get_json(silent=True) or {}
+        if options.get('reset'):
+            profiler.reset()
+        if options.get('enabled') is True:
+            profiler.start(interval=float(options.get('intervalMs', 10)) / 1000)
+        elif options.get('enabled') is False:
+            profiler.stop()
+        return jsonify({'running': profiler.running, 'samples': profiler.samples,
+                        'intervalMs': profiler.interval * 1000}), 200
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy'}), 200
 
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 200 once the model and recommender are loaded"""
+    status = {
+        'status': 'ready' if resources_ready.is_set() else 'loading',
+        'model': model_status,
+        'recommender': recommender is not None
+    }
+    if resources_error:
+        status.update({'status': 'failed', 'error': resources_error})
+    return jsonify(status), 200 if resources_ready.is_set() else 503
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    if prediction_cache is None:
+        stats = {'enabled': False}
+    else:
+        stats = {'enabled': True, **prediction_cache.stats()}
+    if recommender is not None:
+        stats['recommendations'] = {'enabled': RECOMMENDATION_CACHE_ENTRIES > 0, **recommender.cache_stats()}
+    return jsonify(stats), 200
+
 @app.route('/api/diseases', methods=['GET'])
 def get_diseases():
     diseases = [
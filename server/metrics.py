@@ -0,0 +1,175 @@
+"""Minimal in-process metrics with Prometheus text exposition
+
+Counters, gauges and histograms are plain Python objects guarded by a lock,
+cheap enough to update on every request. Metrics are per process: under
+serve.py each worker reports only its own values.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Default latency buckets in seconds, from 1 ms to 10 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _current_values(self):
+        """Sorted (label values, value) pairs, from the callback if there is one"""
+        if getattr(self, 'callback', None) is not None:
+            return sorted((self._key(labels), value) for labels, value in self.callback())
+        with self._lock:
+            return sorted(self._values.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """A counter incremented directly, or read from a callback at scrape time"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self.callback = callback
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in self._current_values()]
+
+
+class Gauge(Metric):
+    """A gauge set directly, or read from a callback at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in self._current_values()]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        lines = []
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(values[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+
+registry = Registry()
+
+REQUESTS = registry.counter('dermiq_requests_total', 'HTTP requests handled', ['endpoint', 'status'])
+ERRORS = registry.counter('dermiq_errors_total', 'Requests that failed with an unexpected error', ['endpoint'])
+IN_FLIGHT = registry.gauge('dermiq_requests_in_flight', 'HTTP requests currently being handled', ['endpoint'])
+REQUEST_SECONDS = registry.histogram('dermiq_request_seconds', 'HTTP request latency', ['endpoint'])
+STAGE_SECONDS = registry.histogram('dermiq_stage_seconds', 'Time spent in each analysis stage', ['stage'])
+MODEL_BATCH_SIZE = registry.histogram('dermiq_model_batch_size', 'Images per model call',
+                                      buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+MODEL_PREDICT_SECONDS = registry.histogram('dermiq_model_predict_seconds', 'Duration of each model call')
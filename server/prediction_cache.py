@@ -0,0 +1,156 @@
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# A perceptual hash is split into this many bands for near-duplicate lookup.
+# Two hashes within (PHASH_BANDS - 1) bits of each other always share a band.
+PHASH_BANDS = 4
+
+
+def exact_key(pixels):
+    """Hash of the decoded, resized pixels; identical for re-encoded or renamed copies"""
+    data = np.ascontiguousarray(np.asarray(pixels, dtype=np.uint8))
+    return hashlib.blake2b(data.tobytes(), digest_size=16).digest()
+
+
+def perceptual_hash(pixels, hash_size=8):
+    """64-bit difference hash (dHash) of an (H, W, 3) or (1, H, W, 3) pixel array"""
+    pixels = np.asarray(pixels, dtype=np.float32).reshape(pixels.shape[-3:])
+    gray = pixels @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    # Average-pool to (hash_size, hash_size + 1) and compare horizontal neighbours
+    rows = np.array_split(np.arange(gray.shape[0]), hash_size)
+    cols = np.array_split(np.arange(gray.shape[1]), hash_size + 1)
+    small = np.array([[gray[np.ix_(r, c)].mean() for c in cols] for r in rows])
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+class PredictionCache:
+    """Bounded LRU/TTL cache of model predictions keyed by image content.
+
+    In 'exact' mode entries are keyed by a hash of the resized pixel tensor.
+    In 'perceptual' mode they are keyed by a 64-bit dHash, and lookups also
+    match cached images whose hash differs by at most ``max_distance`` bits.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=None, ttl_seconds=3600,
+                 mode='exact', max_distance=0):
+        if mode not in ('exact', 'perceptual'):
+            raise ValueError(f"Unknown prediction cache mode: {mode}")
+        if mode == 'perceptual' and max_distance >= PHASH_BANDS:
+            raise ValueError(f"max_distance must be below {PHASH_BANDS}")
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.mode = mode
+        self.max_distance = max_distance
+
+        self._entries = OrderedDict()  # key -> (expires_at, size, result)
+        self._bands = {}  # (band, value) -> set of perceptual keys
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def key_for(self, pixels):
+        if self.mode == 'perceptual':
+            return perceptual_hash(pixels)
+        return exact_key(pixels)
+
+    def get(self, pixels):
+        """Return a copy of the cached prediction for these pixels, or None"""
+        key = self.key_for(pixels)
+        now = time.monotonic()
+        with self._lock:
+            for candidate in self._candidates(key):
+                expires_at, _, result = self._entries[candidate]
+                if expires_at < now:
+                    self._remove(candidate)
+                    self.expirations += 1
+                    continue
+                self._entries.move_to_end(candidate)
+                self.hits += 1
+                return dict(result)
+            self.misses += 1
+            return None
+
+    def put(self, pixels, result):
+        key = self.key_for(pixels)
+        size = self._entry_size(key, result)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, size, dict(result))
+            self._bytes += size
+            if self.mode == 'perceptual':
+                for band in self._band_keys(key):
+                    self._bands.setdefault(band, set()).add(key)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bands.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+    def _candidates(self, key):
+        """Cached keys that match `key`, closest first"""
+        if key in self._entries:
+            return [key]
+        if self.mode != 'perceptual' or self.max_distance == 0:
+            return []
+
+        nearby = set()
+        for band in self._band_keys(key):
+            nearby.update(self._bands.get(band, ()))
+        distances = sorted((bin(key ^ other).count('1'), other) for other in nearby)
+        return [other for distance, other in distances if distance <= self.max_distance]
+
+    @staticmethod
+    def _band_keys(key):
+        width = 64 // PHASH_BANDS
+        mask = (1 << width) - 1
+        return [(band, (key >> (band * width)) & mask) for band in range(PHASH_BANDS)]
+
+    @staticmethod
+    def _entry_size(key, result):
+        return sys.getsizeof(key) + sys.getsizeof(result) + sum(sys.getsizeof(v) for v in result.values())
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        if self.mode == 'perceptual':
+            for band in self._band_keys(key):
+                members = self._bands.get(band)
+                if members is not None:
+                    members.discard(key)
+                    if not members:
+                        del self._bands[band]
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
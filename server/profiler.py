@@ -0,0 +1,79 @@
+import sys
+import threading
+from collections import Counter
+
+# Distinct stacks kept before the rarest are dropped
+MAX_STACKS = 10000
+
+
+class SamplingProfiler:
+    """Statistical profiler that can be switched on and off at runtime.
+
+    While running, a background thread samples the Python stack of every
+    other thread each `interval` seconds and counts identical stacks. The
+    result is in collapsed-stack format (``frame;frame;frame count``), which
+    flame graph tools read directly. When stopped it costs nothing.
+    """
+
+    def __init__(self):
+        self._stacks = Counter()
+        self._lock = threading.Lock()
+        self._stop = None
+        self._thread = None
+        self.interval = 0.01
+        self.samples = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=0.01):
+        with self._lock:
+            if self.running:
+                return
+            self.interval = interval
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop,), name='sampling-profiler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            if self._stop is not None:
+                self._stop.set()
+            self._thread = None
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+
+    def collapsed(self):
+        """Sampled stacks in collapsed-stack format, most frequent first"""
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def _run(self, stop):
+        own_id = threading.get_ident()
+        while not stop.wait(self.interval):
+            frames = sys._current_frames()
+            sampled = []
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                sampled.append(';'.join(reversed(stack)))
+            del frames
+
+            with self._lock:
+                self._stacks.update(sampled)
+                self.samples += 1
+                if len(self._stacks) > MAX_STACKS:
+                    self._stacks = Counter(dict(self._stacks.most_common(MAX_STACKS // 2)))
+
+
+profiler = SamplingProfiler()
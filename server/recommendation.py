@@ -1,17 +1,91 @@
+import threading
+from collections import OrderedDict, namedtuple
 import numpy as np
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import scipy.sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from catalog_index import CATALOG_COLUMNS, CatalogIndex
+from catalog_store import diff_catalogs, load_catalog, normalize_catalog
+from similarity import TopKNeighbors
+
+# Everything derived from one version of the catalog. Requests read the
+# current state once, so a catalog update swapped in mid-request is never
+# mixed with the previous version. `neighbors` is None until a request with
+# prior products first needs it: building it takes O(n^2) time.
+CatalogState = namedtuple('CatalogState', ['version', 'index', 'features', 'neighbors'])
+
+# Memoized (disease, skin type) product rankings kept at once
+MAX_RANKED_ENTRIES = 32
+
+def age_bucket(age):
+    """Age bracket the recommendations depend on: under 18, 18-60 or over 60"""
+    return 0 if age < 18 else 2 if age > 60 else 1
+
+def allergen_key(allergies):
+    """Allergies as the catalog filter sees them: trimmed, lowercase, unordered"""
+    return frozenset(a.strip().lower() for a in allergies if a.strip())
 
 class SkinCareRecommender:
-    def __init__(self):
+    def __init__(self, catalog_path=None, num_neighbors=10, cache_size=4096):
         # Initialize with product database
-        # In a real system, this would come from a database
-        self.products_df = self._create_product_database()
+        # Loaded from catalog_path (CSV, JSON/JSONL or SQLite) when given,
+        # otherwise from the built-in mock catalog
+        self.catalog_path = catalog_path
+        if catalog_path:
+            products_df = load_catalog(catalog_path)
+        else:
+            products_df = normalize_catalog(self._create_product_database())
         
-        # Create vectorizer for content-based filtering
-        self.vectorizer = TfidfVectorizer(stop_words='english')
-        self.product_features = self._prepare_product_features()
+        # Create vectorizer for content-based filtering. Hashing needs no fitted
+        # vocabulary, so new products are vectorized without touching the rest.
+        self.vectorizer = HashingVectorizer(stop_words='english', alternate_sign=False,
+                                            norm='l2', n_features=2 ** 18)
+        self.num_neighbors = num_neighbors
+        # Profile text vectors by (disease, skin type); there are only a handful
+        self._profile_vectors = {}
+        # Products for a disease ranked by similarity to (disease, skin type),
+        # for the catalog version they were ranked on
+        self._ranked = {}
+        # Recommended products by normalized profile, least recently used first.
+        # Real traffic collapses onto a few hundred distinct profiles.
+        self.cache_size = cache_size
+        self._recommendation_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        
+        # Index the catalog once so filtering doesn't scan it on every request
+        self._update_lock = threading.Lock()
+        self._set_catalog(self._build_catalog(products_df, version=1))
+    
+    @property
+    def index(self):
+        return self.catalog.index
+    
+    @property
+    def product_features(self):
+        return self._neighbors(self.catalog)
+    
+    @property
+    def products_df(self):
+        return self.catalog.index.to_dataframe()
+    
+    def _set_catalog(self, catalog):
+        """Swap in a new catalog state, dropping recommendations made from the old one"""
+        self.catalog = catalog
+        self.clear_cache()
+    
+    def clear_cache(self):
+        with self._cache_lock:
+            self._recommendation_cache.clear()
+    
+    def cache_stats(self):
+        with self._cache_lock:
+            return {
+                'entries': len(self._recommendation_cache),
+                'hits': self.cache_hits,
+                'misses': self.cache_misses,
+            }
         
     def _create_product_database(self):
         """Create a mock product database"""
@@ -115,22 +189,80 @@ class SkinCareRecommender:
         
         return pd.DataFrame(products)
     
-    def _prepare_product_features(self):
+    def _prepare_product_features(self, products_df):
         """Prepare product features for content-based filtering"""
         # Combine relevant features for content-based filtering
-        self.products_df['features'] = self.products_df['description'] + ' ' + \
-                                       self.products_df['disease'] + ' ' + \
-                                       self.products_df['ingredients'] + ' ' + \
-                                       self.products_df['skin_types'] + ' ' + \
-                                       self.products_df['tags']
+        features = products_df['description'] + ' ' + \
+                   products_df['disease'] + ' ' + \
+                   products_df['ingredients'] + ' ' + \
+                   products_df['skin_types'] + ' ' + \
+                   products_df['tags']
         
-        # Create TF-IDF matrix
-        tfidf_matrix = self.vectorizer.fit_transform(self.products_df['features'])
+        return self.vectorizer.transform(features).tocsr()
+    
+    def _build_catalog(self, products_df, version):
+        """Build every catalog structure from scratch, except the neighbour lists"""
+        features = self._prepare_product_features(products_df)
+        return CatalogState(version, CatalogIndex(products_df), features, None)
+    
+    def _neighbors(self, catalog):
+        """Neighbour lists of `catalog`, built the first time they are needed"""
+        if catalog.neighbors is not None:
+            return catalog.neighbors
+        with self._update_lock:
+            current = self.catalog
+            if current.version == catalog.version and current.neighbors is not None:
+                return current.neighbors
+            # Keep only each product's most similar products instead of the full n x n matrix
+            neighbors = TopKNeighbors.build(catalog.features, k=self.num_neighbors)
+            if current is catalog:
+                # Same catalog version, so cached recommendations stay valid
+                self.catalog = catalog._replace(neighbors=neighbors)
+            return neighbors
+    
+    def apply_catalog_changes(self, upserts=None, deleted_ids=()):
+        """Add, update and delete products without rebuilding the catalog
+
+        `upserts` is a DataFrame or list of product dicts; products whose id
+        already exists are replaced. Only the index entries and neighbour
+        lists the change affects are recomputed, and the new catalog state is
+        swapped in atomically while requests keep using the previous one.
+        """
+        with self._update_lock:
+            return self._apply_changes(upserts, deleted_ids)
+    
+    def reload_catalog(self, path=None):
+        """Reload the catalog file and apply only what changed in it"""
+        with self._update_lock:
+            new_df = load_catalog(path or self.catalog_path)
+            upserts, deleted_ids = diff_catalogs(self.catalog.index.to_dataframe(), new_df)
+            if upserts.empty and not deleted_ids:
+                return 0, 0
+            return self._apply_changes(upserts, deleted_ids)
+    
+    def _apply_changes(self, upserts, deleted_ids):
+        current = self.catalog
+        if upserts is None:
+            upserts = pd.DataFrame(columns=CATALOG_COLUMNS)
+        upserts_df = normalize_catalog(pd.DataFrame(upserts))
         
-        # Calculate similarity between products
-        cosine_sim = cosine_similarity(tfidf_matrix, tfidf_matrix)
+        index, appended_rows, removed_rows = current.index.apply_changes(upserts_df, deleted_ids)
+        if index.needs_compaction():
+            # Too many dead rows; rebuild so lookups don't keep skipping them
+            self._set_catalog(self._build_catalog(index.to_dataframe(), current.version + 1))
+        else:
+            features = current.features
+            if len(upserts_df):
+                # The vectorizer can't transform an empty frame, so deletions skip it
+                features = scipy.sparse.vstack([features, self._prepare_product_features(upserts_df)],
+                                               format='csr')
+            # Patch the neighbour lists only if something has built them already
+            neighbors = None
+            if current.neighbors is not None:
+                neighbors = current.neighbors.updated(features, index.alive, appended_rows, removed_rows)
+            self._set_catalog(CatalogState(current.version + 1, index, features, neighbors))
         
-        return cosine_sim
+        return len(upserts_df), len(deleted_ids)
         
     def get_disease_remedies(self, disease):
         """Get standard remedies for a disease"""
@@ -207,64 +339,130 @@ class SkinCareRecommender:
         return personalized_remedies
     
     def recommend_products(self, disease, user_details, num_recommendations=3):
-        """Recommend products based on disease and user preferences"""
-        # Filter products by disease
-        disease_products = self.products_df[self.products_df['disease'].str.contains(disease)]
-        
-        if disease_products.empty:
-            return []
-        
-        # Filter further based on user details
+        """Recommend products based on disease and user preferences
+
+        Results are cached by everything they depend on: the catalog
+        version, disease, skin type, age bracket, allergen set and prior
+        products. Ranking is deterministic, so a cached answer is exactly
+        what recomputing it would return.
+        """
+        catalog = self.catalog
         skin_type = user_details.get('skinType', '').lower()
         age = user_details.get('age', 30)
-        allergies = [a.lower() for a in user_details.get('allergies', [])]
+        allergies = user_details.get('allergies', [])
+        prior_product_ids = user_details.get('priorProducts', [])
         
-        # Filter by skin type if specified
-        if skin_type:
-            skin_type_products = disease_products[disease_products['skin_types'].str.contains(skin_type)]
-            if not skin_type_products.empty:
-                disease_products = skin_type_products
+        key = (catalog.version, disease.strip().lower(), skin_type, age_bucket(age), allergen_key(allergies),
+               tuple(int(product_id) for product_id in prior_product_ids), num_recommendations)
+        if self.cache_size > 0:
+            with self._cache_lock:
+                products = self._recommendation_cache.get(key)
+                if products is not None:
+                    self._recommendation_cache.move_to_end(key)
+                    self.cache_hits += 1
+                    return [dict(product) for product in products]
+                self.cache_misses += 1
         
-        # Filter by age appropriateness
-        if age < 18:
-            age_appropriate = disease_products[
-                (disease_products['age_range'] == 'all') | 
-                (disease_products['age_range'] == 'child')
-            ]
-            if not age_appropriate.empty:
-                disease_products = age_appropriate
+        products = self._select_products(catalog, disease, skin_type, age, allergies, prior_product_ids,
+                                         num_recommendations)
         
-        # Filter out products containing allergens
-        if allergies:
-            filtered_products = disease_products.copy()
-            for allergen in allergies:
-                filtered_products = filtered_products[~filtered_products['ingredients'].str.contains(allergen, case=False)]
-            
-            if not filtered_products.empty:
-                disease_products = filtered_products
+        if self.cache_size > 0:
+            with self._cache_lock:
+                # Don't cache results from a catalog that was swapped out meanwhile
+                if catalog.version == self.catalog.version:
+                    self._recommendation_cache[key] = products
+                    while len(self._recommendation_cache) > self.cache_size:
+                        self._recommendation_cache.popitem(last=False)
+            products = [dict(product) for product in products]
+        return products
+    
+    def _select_products(self, catalog, disease, skin_type, age, allergies, prior_product_ids, num_recommendations):
+        index = catalog.index
+        allergies = [a.lower() for a in allergies]
         
-        # If we have no products after filtering, return to disease-based products
-        if disease_products.empty:
-            disease_products = self.products_df[self.products_df['disease'].str.contains(disease)]
+        if not prior_product_ids:
+            # Products that pass the skin type and age filters, most relevant
+            # first: the first allergen-free ones are the recommendation
+            ranked_rows = self._ranked_rows(catalog, disease, skin_type)[age < 18]
+            recommended_rows = index.first_allergen_free(ranked_rows, num_recommendations, allergies)
+            return index.format_products(recommended_rows)
         
-        # Select top products
-        if len(disease_products) <= num_recommendations:
-            recommended_products = disease_products
-        else:
-            # For more sophisticated selection, could use collaborative filtering or user preference learning
-            # For now, just select a diverse set
-            recommended_products = disease_products.sample(num_recommendations)
+        # Filter products by disease
+        disease_rows = index.disease_rows(disease)
+        
+        if len(disease_rows) == 0:
+            return []
+        
+        # Filter further based on user details (skin type, age appropriateness, allergens)
+        candidate_rows = index.filter_rows(disease_rows, skin_type=skin_type, age=age, allergies=allergies)
+        
+        # Select top products, ranked by similarity to the user's profile and prior products
+        recommended_rows = self._rank_products(catalog, candidate_rows, disease, skin_type,
+                                               prior_product_ids)[:num_recommendations]
         
         # Format for API response
-        result = []
-        for _, product in recommended_products.iterrows():
-            result.append({
-                "name": product['name'],
-                "imageUrl": product['image_url'],
-                "description": product['description']
-            })
+        return index.format_products(recommended_rows)
+    
+    def _rank_products(self, catalog, rows, disease, skin_type, prior_product_ids):
+        """Order candidate rows by relevance, most relevant first
+
+        Relevance is the text similarity between a product and the user's
+        profile, plus its neighbour similarity to products the user already
+        has. Products the user already has are moved to the end, and ties
+        are broken by catalog order so the ranking is deterministic.
+        """
+        profile = self._profile_vector(disease, skin_type)
+        relevance = (catalog.features[rows] @ profile).toarray().ravel()
+        
+        prior_rows = [catalog.index.row_by_id[int(product_id)] for product_id in prior_product_ids
+                      if int(product_id) in catalog.index.row_by_id]
+        if prior_rows:
+            position = {row: i for i, row in enumerate(rows)}
+            neighbors = self._neighbors(catalog)
+            for prior_row in prior_rows:
+                neighbor_rows, neighbor_scores = neighbors.neighbors(prior_row)
+                for neighbor_row, score in zip(neighbor_rows, neighbor_scores):
+                    if neighbor_row in position:
+                        relevance[position[neighbor_row]] += score
         
-        return result
+        already_owned = np.isin(rows, prior_rows)
+        order = np.lexsort((rows, -relevance, already_owned))
+        return rows[order]
+    
+    def _ranked_rows(self, catalog, disease, skin_type):
+        """(adult, child) candidate rows in _rank_products order, memoized
+
+        These are the disease's products after the skin type filter and,
+        for children, the age filter, ranked as _rank_products ranks them
+        without prior products. Neither filter depends on anything else in
+        the profile, so only the allergen filter is left for each request.
+        """
+        key = (disease, skin_type)
+        entry = self._ranked.get(key)
+        if entry is None or entry[0] != catalog.version:
+            index = catalog.index
+            rows = index.disease_rows(disease)
+            profile = self._profile_vector(disease, skin_type)
+            relevance = (catalog.features[rows] @ profile).toarray().ravel()
+            rows = rows[np.lexsort((rows, -relevance))]
+            entry = (catalog.version, (index.filter_rows(rows, skin_type=skin_type, age=30),
+                                       index.filter_rows(rows, skin_type=skin_type, age=0)))
+            # Each entry holds up to twice the rows of its disease, so keep few
+            if len(self._ranked) >= MAX_RANKED_ENTRIES:
+                self._ranked.clear()
+            self._ranked[key] = entry
+        return entry[1]
+    
+    def _profile_vector(self, disease, skin_type):
+        """Hashed text vector of a user profile, memoized"""
+        key = (disease, skin_type)
+        vector = self._profile_vectors.get(key)
+        if vector is None:
+            vector = self.vectorizer.transform([f"{disease} {skin_type}"]).T.tocsr()
+            if len(self._profile_vectors) >= 1024:
+                self._profile_vectors.clear()
+            self._profile_vectors[key] = vector
+        return vector
     
     def get_recommendations(self, disease, user_details):
         """Get complete recommendations including personalized remedies and products"""
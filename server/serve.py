@@ -0,0 +1,95 @@
+"""Production entry point: serve the API with multiple gunicorn workers
+
+Usage:
+    python serve.py
+
+The recommender and catalog are loaded once in the master process before
+workers are forked, so every worker shares their pages copy-on-write
+instead of loading its own copy. TFLite models are shared the same way.
+The Keras backend is not: TensorFlow's runtime is not fork-safe once it
+has started its thread pools, so each worker loads its own Keras model
+after fork and answers analysis requests with 503 until it has. The
+catalog watcher likewise runs only in the workers. Set
+DERMIQ_JOB_STORE_DIR so a job submitted to /api/jobs can be polled
+through any worker.
+
+Configured through environment variables (besides those read by main.py):
+    DERMIQ_BIND       address to listen on (default 0.0.0.0:5000)
+    DERMIQ_WORKERS    worker processes (default: one per CPU core)
+    DERMIQ_THREADS    request threads per worker (default: enough to
+                      cover the inference pool and its queue, so overload
+                      is answered with 429 rather than left waiting)
+    DERMIQ_WORKER_TIMEOUT  seconds before a stuck worker is restarted
+
+DERMIQ_INTRA_OP_THREADS defaults to the cores divided between the workers
+and DERMIQ_INTER_OP_THREADS to 1, so the workers' inference thread pools
+don't oversubscribe the machine.
+"""
+import gc
+import os
+import sys
+
+from gunicorn.app.base import BaseApplication
+
+
+def post_fork(server, worker):
+    import main
+    # Threads don't survive fork(), and the master starts no catalog watcher
+    # (see run); start the ones each worker needs
+    main.start_catalog_watcher()
+    if main.DEFER_MODEL_LOAD:
+        main.load_model_in_worker()
+
+
+class DermiqApplication(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        import main
+        # Fork only once everything is loaded, even with DERMIQ_FAST_START
+        while not main.resources_ready.wait(1):
+            if main.resources_error:
+                print(f"Not starting workers: {main.resources_error}")
+                sys.exit(1)
+        # Move everything loaded so far out of the garbage collector's reach,
+        # so collections in the workers don't touch (and copy) shared pages
+        gc.freeze()
+        return main.app
+
+
+def run():
+    # The master serves nothing, so its watcher would only reload the
+    # catalog for nobody, and a fork while it held its lock would leave the
+    # worker's copy locked for good; only the workers watch (see post_fork)
+    os.environ['DERMIQ_DEFER_CATALOG_WATCHER'] = '1'
+    if os.environ.get('DERMIQ_INFERENCE_BACKEND', 'keras') == 'keras':
+        # Keep TensorFlow out of the master; see post_fork
+        os.environ['DERMIQ_DEFER_MODEL_LOAD'] = '1'
+    cores = os.cpu_count() or 1
+    workers = int(os.environ.get('DERMIQ_WORKERS', cores))
+    # Each worker's inference pools default to one thread per core; split
+    # the cores between the workers instead of running cores² threads
+    os.environ.setdefault('DERMIQ_INTRA_OP_THREADS', str(max(1, cores // workers)))
+    os.environ.setdefault('DERMIQ_INTER_OP_THREADS', '1')
+    import main as dermiq
+    default_threads = dermiq.INFERENCE_WORKERS + dermiq.INFERENCE_QUEUE_DEPTH + 4
+    options = {
+        'bind': os.environ.get('DERMIQ_BIND', '0.0.0.0:5000'),
+        'workers': workers,
+        'worker_class': 'gthread',
+        'threads': int(os.environ.get('DERMIQ_THREADS', default_threads)),
+        'timeout': int(os.environ.get('DERMIQ_WORKER_TIMEOUT', 2 * dermiq.REQUEST_TIMEOUT)),
+        'preload_app': True,
+        'post_fork': post_fork,
+    }
+    DermiqApplication(options).run()
+
+
+if __name__ == '__main__':
+    run()
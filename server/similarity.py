@@ -0,0 +1,130 @@
+import numpy as np
+
+# Upper bound on the dense similarity block held in memory while building
+DEFAULT_BLOCK_BYTES = 64 * 1024 ** 2
+
+
+def top_k_order(scores, columns, k):
+    """Positions of the k best scores, ordered by score then column
+
+    Ordering on (score desc, column asc) makes the result independent of
+    how ties happen to fall in np.partition.
+    """
+    if len(scores) > k:
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)
+        ties = ties[np.argsort(columns[ties], kind='stable')][:k - len(above)]
+        keep = np.concatenate([above, ties])
+    else:
+        keep = np.arange(len(scores))
+    return keep[np.lexsort((columns[keep], -scores[keep]))]
+
+
+class TopKNeighbors:
+    """Each product's k most similar products, as fixed-width arrays.
+
+    ``rows[i]`` holds the neighbour rows of product row ``i`` (most similar
+    first, padded with -1) and ``scores[i]`` their cosine similarities, so
+    memory is O(n * k) instead of the O(n^2) of a full similarity matrix.
+    """
+
+    def __init__(self, rows, scores):
+        self.rows = rows
+        self.scores = scores
+
+    @property
+    def k(self):
+        return self.rows.shape[1]
+
+    def neighbors(self, row):
+        """(rows, scores) of the neighbours of `row`, most similar first"""
+        valid = self.rows[row] >= 0
+        return self.rows[row][valid], self.scores[row][valid]
+
+    @classmethod
+    def build(cls, features, k=10, block_bytes=DEFAULT_BLOCK_BYTES):
+        """Build from an L2-normalized sparse feature matrix (e.g. TF-IDF)
+
+        Similarities are computed a block of rows at a time, with the block
+        sized so the dense (block, n) slice stays within `block_bytes`.
+        Products with zero similarity are never listed as neighbours.
+        """
+        n = features.shape[0]
+        neighbors = cls(np.full((n, k), -1, dtype=np.int32), np.zeros((n, k), dtype=np.float32))
+        neighbors._compute_rows(features, np.arange(n), block_bytes=block_bytes)
+        return neighbors
+
+    def _compute_rows(self, features, targets, alive=None, block_bytes=DEFAULT_BLOCK_BYTES):
+        """Recompute the neighbour lists of `targets` against every live row"""
+        n = features.shape[0]
+        if n == 0 or len(targets) == 0:
+            return
+
+        features = features.tocsr()
+        transposed = features.T.tocsc()
+        block_rows = max(1, block_bytes // (8 * n))
+
+        for start in range(0, len(targets), block_rows):
+            block_targets = targets[start:start + block_rows]
+            block = (features[block_targets] @ transposed).toarray()
+            # A product is not its own neighbour, and dead rows are nobody's
+            block[np.arange(len(block_targets)), block_targets] = 0
+            if alive is not None:
+                block[:, ~alive] = 0
+
+            for i, target in enumerate(block_targets):
+                row_scores = block[i]
+                nonzero = np.flatnonzero(row_scores > 0)
+                best = nonzero[top_k_order(row_scores[nonzero], nonzero, self.k)]
+                self.rows[target] = -1
+                self.scores[target] = 0
+                self.rows[target, :len(best)] = best
+                self.scores[target, :len(best)] = row_scores[best]
+
+    def updated(self, features, alive, appended_rows, removed_rows, block_bytes=DEFAULT_BLOCK_BYTES):
+        """Return neighbours patched for a catalog change
+
+        `features` and `alive` describe the catalog after the change, in
+        which `appended_rows` were added and `removed_rows` died. Only
+        these rows, rows that listed a removed row, and rows an appended
+        row now outranks are touched; the rest are copied unchanged.
+        """
+        n = features.shape[0]
+        grown = n - len(self.rows)
+        rows = np.concatenate([self.rows, np.full((grown, self.k), -1, dtype=np.int32)])
+        scores = np.concatenate([self.scores, np.zeros((grown, self.k), dtype=np.float32)])
+        neighbors = TopKNeighbors(rows, scores)
+
+        # Dead rows have no neighbours
+        rows[removed_rows] = -1
+        scores[removed_rows] = 0
+
+        # Rows that lost a neighbour need a full recompute to refill their list
+        stale = np.flatnonzero(np.isin(rows, removed_rows).any(axis=1) & alive)
+        recompute = np.union1d(appended_rows, stale)
+        neighbors._compute_rows(features, recompute, alive=alive, block_bytes=block_bytes)
+
+        # Everyone else only needs to consider the appended rows as new candidates
+        features = features.tocsr()
+        transposed = features.T.tocsc()
+        block_rows = max(1, block_bytes // (8 * max(n, 1)))
+        for start in range(0, len(appended_rows), block_rows):
+            block_appended = appended_rows[start:start + block_rows]
+            similarity = (features[block_appended] @ transposed).toarray()
+            similarity[:, ~alive] = 0
+            similarity[:, recompute] = 0
+            worst = np.where(rows[:, -1] >= 0, scores[:, -1], 0)
+            for target in np.flatnonzero((similarity > worst).any(axis=0)):
+                current = rows[target] >= 0
+                candidate_rows = np.concatenate([rows[target][current], block_appended])
+                candidate_scores = np.concatenate([scores[target][current], similarity[:, target]])
+                keep = candidate_scores > 0
+                candidate_rows, candidate_scores = candidate_rows[keep], candidate_scores[keep]
+                best = top_k_order(candidate_scores, candidate_rows, self.k)
+                rows[target] = -1
+                scores[target] = 0
+                rows[target, :len(best)] = candidate_rows[best]
+                scores[target, :len(best)] = candidate_scores[best]
+
+        return neighbors
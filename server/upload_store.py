@@ -0,0 +1,135 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+# Temporary files older than this were left by a writer that died
+STALE_TMP_SECONDS = 3600
+
+
+class UploadStore:
+    """Content-addressed, size-bounded store for original uploads.
+
+    Files are named by the SHA-256 of their bytes, so identical uploads are
+    stored once and two users uploading ``image.jpg`` never collide. Writes
+    happen on a background thread; when the store grows past ``max_bytes``
+    the least recently stored files are deleted.
+
+    Several processes (e.g. serve.py workers) may share a root. Each one
+    re-reads the directory every ``rescan_seconds`` and evicts by
+    modification time, so the directory holds at most ``max_bytes`` plus
+    whatever all of them write between two rescans.
+    """
+
+    def __init__(self, root, max_bytes=1024 ** 3, max_pending=256, rescan_seconds=60):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        self.rescan_seconds = rescan_seconds
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._entries = OrderedDict()  # path -> size, oldest first
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+        self._last_scan = 0
+
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    def put(self, data, extension):
+        """Schedule the upload to be persisted and return its content hash"""
+        digest = hashlib.sha256(data).hexdigest()
+        self._ensure_worker()
+        try:
+            self._pending.put_nowait((digest, extension.lower(), data))
+        except queue.Full:
+            # Persisting originals is best effort; never stall a request on it
+            print(f"Upload store backlog full, skipping {digest}")
+        return digest
+
+    def path_for(self, digest, extension):
+        return os.path.join(self.root, digest[:2], f"{digest}.{extension.lower()}")
+
+    def _scan(self):
+        """Rebuild the size index from the files on disk, whoever wrote them"""
+        found = []
+        now = time.time()
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                    if name.endswith('.tmp'):
+                        # Another process may still be writing a recent one
+                        if now - stat.st_mtime > STALE_TMP_SECONDS:
+                            os.remove(path)
+                        continue
+                except FileNotFoundError:
+                    # Evicted by another process meanwhile
+                    continue
+                found.append((stat.st_mtime, path, stat.st_size))
+
+        self._entries = OrderedDict((path, size) for _, path, size in sorted(found))
+        self._total_bytes = sum(self._entries.values())
+        self._last_scan = time.monotonic()
+        self._evict()
+
+    def _ensure_worker(self):
+        # Threads do not survive fork(), so start the writer in whichever
+        # process first stores an upload.
+        pid = os.getpid()
+        if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run, name='upload-store', daemon=True)
+            self._worker_pid = pid
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            digest, extension, data = self._pending.get()
+            try:
+                self._write(digest, extension, data)
+            except OSError as e:
+                print(f"Error persisting upload {digest}: {e}")
+
+    def _write(self, digest, extension, data):
+        if time.monotonic() - self._last_scan > self.rescan_seconds:
+            # Pick up what other processes stored and evicted since
+            self._scan()
+
+        path = self.path_for(digest, extension)
+        try:
+            # Already stored, maybe by another process? Mark it as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        else:
+            if path not in self._entries:
+                self._entries[path] = len(data)
+                self._total_bytes += len(data)
+            self._entries.move_to_end(path)
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        self._entries[path] = len(data)
+        self._total_bytes += len(data)
+        self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            path, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass